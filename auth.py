@@ -1,98 +1,146 @@
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 
-import bcrypt
+from db import get_connection
+from hashing import HashingBusyError, check_password, hash_password, needs_rehash
+from session_store import get_session_store
 
+# Minimum number of seconds between two purges of expired sessions
+PURGE_INTERVAL = 300
+# Sessions expire this long after the user was last seen
+SESSION_LIFETIME = timedelta(hours=12)
+# Minimum time between two expiry extensions of the same session, so active
+# users cause at most one (buffered) write per session per interval
+TOUCH_INTERVAL = timedelta(minutes=5)
 
-# Register a new user in the database
+# Auth context of the current script run: (session_id, (username, roles))
+_request = threading.local()
+
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+
+# Start a new script run; the next verify_session call re-reads the database
+def begin_request():
+    _request.auth = None
+
+
+# Register a new user in the database.
+# Raises hashing.HashingBusyError when the hashing pool is saturated.
 def register_user(username, password, role="user"):
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    try:
-        hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-        c.execute(
-            "INSERT INTO users (username, password) VALUES (?, ?)", (username.lower(), hashed)
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    hashed = hash_password(password)
+    with get_connection() as conn:
+        c = conn.cursor()
+        try:
+            c.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?)", (username.lower(), hashed)
+            )
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 
-# Verify user credentials and return True if valid
+# Verify user credentials and return True if valid. A hash stored with a
+# lower cost factor than the current target is upgraded on success.
+# Raises hashing.HashingBusyError when the hashing pool is saturated.
 def verify_user(username, password):
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT password FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result and bcrypt.checkpw(password.encode(), result[0]):
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT password FROM users WHERE username = ?", (username,))
+        result = c.fetchone()
+    if result and check_password(password, result[0]):
+        if needs_rehash(result[0]):
+            _rehash_password(username, password, result[0])
         return True
     return False
 
 
+# Store a new hash at the current cost factor, unless the password changed meanwhile
+def _rehash_password(username, password, old_hash):
+    try:
+        hashed = hash_password(password)
+    except HashingBusyError:
+        # Not critical; retried on the next login
+        return
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "UPDATE users SET password = ? WHERE username = ? AND password = ?",
+            (hashed, username, old_hash),
+        )
+        conn.commit()
+
+
 # Create a new session for the user and store it in cookies
 def create_session(username, cookies):
     import uuid
 
     session_id = str(uuid.uuid4())
-    expiry = datetime.now() + timedelta(days=0.5)
-    
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
+    expiry = datetime.now() + SESSION_LIFETIME
+
+    get_session_store().add(session_id, username.lower(), expiry)
+    cookies["session_id"] = session_id
+    cookies.save()
+    begin_request()
+    return session_id
+
+
+# Verify the current session using cookies. The result is resolved once per
+# script run and reused by every later call with the same session_id.
+def verify_session(cookies):
+    session_id = cookies.get("session_id")
+    cached = getattr(_request, "auth", None)
+    if cached is None or cached[0] != session_id:
+        cached = (session_id, _resolve_session(session_id))
+        _request.auth = cached
+    username, roles = cached[1]
+    return username, list(roles)
+
+
+# Delete expired sessions, at most once every PURGE_INTERVAL seconds per process.
+# Returns the number of deleted sessions.
+def purge_expired_sessions(force=False):
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < PURGE_INTERVAL:
+        return 0
+    # Another thread is already purging
+    if not _purge_lock.acquire(blocking=False):
+        return 0
     try:
-        c.execute(
-            "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
-            (session_id, username.lower(), expiry),
-        )
-        conn.commit()
-        cookies["session_id"] = session_id
-        cookies.save()
-        return session_id
-    except Exception as e:
-        conn.rollback()
-        raise e
+        _last_purge = now
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM sessions WHERE expiry < ?", (datetime.now(),))
+            conn.commit()
+            return c.rowcount
+    except sqlite3.OperationalError:
+        # Database busy; try again on a later call
+        return 0
     finally:
-        conn.close()
+        _purge_lock.release()
 
 
-# Verify the current session using cookies and clean up expired sessions
-def verify_session(cookies):
+# Look up the user and roles for a session_id. Expired sessions never match,
+# so purging them is only housekeeping and stays off the lookup path.
+def _resolve_session(session_id):
     try:
-        # Clean up expired sessions
-        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-        c = conn.cursor()
-        c.execute("DELETE FROM sessions WHERE expiry < ?", (datetime.now(),))
-        conn.commit()
-        
-        session_id = cookies.get("session_id")
+        purge_expired_sessions()
         if not session_id:
-            conn.close()
             return None, []
-            
-        # Get the username for the current session_id
-        c.execute("SELECT username FROM sessions WHERE session_id = ?", (session_id,))
-        user_result = c.fetchone()
-        if not user_result:
-            conn.close()
+
+        store = get_session_store()
+        record = store.get(session_id)
+        if not record:
             return None, []
-            
-        username = user_result[0]
-        
-        # Get all sessions for this user
-        c.execute("SELECT expiry FROM sessions WHERE username = ?", (username,))
-        sessions = c.fetchall()
-        for session in sessions:
-            if datetime.now() < session[0]:
-                # Fetch all roles for this user
-                c.execute("SELECT role FROM user_roles WHERE username = ?", (username,))
-                roles = [row[0] for row in c.fetchall()]
-                conn.close()
-                return username, roles
-        conn.close()
-        return None, []
+        # Sliding expiry: the record's expiry tells when it was last extended
+        expiry = datetime.now() + SESSION_LIFETIME
+        if expiry - record[2] >= TOUCH_INTERVAL:
+            store.extend(session_id, expiry)
+        return record[0], list(record[1])
     except Exception as e:
         # If there's any error in session verification, return None
         return None, []
@@ -102,10 +150,7 @@ def verify_session(cookies):
 def clear_session(cookies):
     session_id = cookies.get("session_id")
     if session_id:
-        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-        c = conn.cursor()
-        c.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-        conn.commit()
-        conn.close()
+        get_session_store().delete(session_id)
         cookies.pop("session_id", None)
         cookies.save()
+    begin_request()
@@ -0,0 +1,5 @@
+"""Benchmarks for the app. Run them from the repository root, e.g.
+
+    python -m benchmarks.reruns --users 1000 --snippets 5000
+    python -m benchmarks.session_store
+"""
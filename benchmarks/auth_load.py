@@ -0,0 +1,209 @@
+"""Concurrent load test of verify_user, create_session and verify_session.
+
+Seed a database first, then point the driver at it:
+
+    python -m benchmarks.seed bench.db --users 100000 --sessions 1000000 --snippets 0
+    python -m benchmarks.auth_load bench.db --threads 50 --duration 30
+
+Reports throughput, latency percentiles and histograms, and error rates
+("database is locked" counted separately) per operation, as JSON.
+
+Sessions are written synchronously so their lock errors are measured; pass
+--write-behind to buffer them as the app does, in which case create_session
+only measures the buffering and the background flushes are not reported.
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Seeded hashes use cost 4; must be set before hashing is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import auth  # noqa: E402
+import db  # noqa: E402
+import session_store  # noqa: E402
+from benchmarks.seed import SEED_PASSWORD  # noqa: E402
+from hashing import HashingBusyError  # noqa: E402
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+OPERATIONS = ("verify_user", "create_session", "verify_session")
+
+
+# Stand-in for the cookie component
+class LoadCookies(dict):
+    def save(self):
+        pass
+
+
+# Per-operation latencies and error counts collected by the workers
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def merge(self, latencies, errors):
+        with self._lock:
+            for op, values in latencies.items():
+                self.latencies[op].extend(values)
+            for op, counts in errors.items():
+                self.errors[op].update(counts)
+
+    def summary(self, elapsed):
+        report = {}
+        for op in OPERATIONS:
+            values = sorted(self.latencies[op])
+            errors = self.errors[op]
+            total = len(values) + sum(errors.values())
+            if not total:
+                continue
+            histogram = Counter(bisect.bisect_left(HISTOGRAM_MS, v) for v in values)
+            report[op] = {
+                "operations": total,
+                "ops_per_s": round(total / elapsed, 1),
+                "p50_ms": _percentile(values, 0.50),
+                "p95_ms": _percentile(values, 0.95),
+                "p99_ms": _percentile(values, 0.99),
+                "max_ms": round(values[-1], 3) if values else None,
+                "histogram_ms": {
+                    (f"<={HISTOGRAM_MS[i]}" if i < len(HISTOGRAM_MS) else f">{HISTOGRAM_MS[-1]}"): histogram[i]
+                    for i in range(len(HISTOGRAM_MS) + 1)
+                    if histogram[i]
+                },
+                "errors": dict(errors),
+                "locked_rate": round(errors["database is locked"] / total, 5),
+                "error_rate": round(sum(errors.values()) / total, 5),
+            }
+        return report
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
+
+
+# Load a sample of existing usernames and session ids to drive the operations
+def _load_sample(size):
+    with db.get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT username FROM users ORDER BY RANDOM() LIMIT ?", (size,))
+        usernames = [row[0] for row in c.fetchall()]
+        c.execute("SELECT session_id FROM sessions ORDER BY RANDOM() LIMIT ?", (size,))
+        session_ids = [row[0] for row in c.fetchall()]
+    return usernames, session_ids
+
+
+# Run one operation; returns an error label or None on success
+def _run_operation(op, rng, usernames, session_ids):
+    try:
+        if op == "verify_user":
+            if not auth.verify_user(rng.choice(usernames), SEED_PASSWORD):
+                return "rejected"
+        elif op == "create_session":
+            auth.create_session(rng.choice(usernames), LoadCookies())
+        else:
+            # The store is called directly: auth.verify_session reports database
+            # errors as logged out, which would hide lock errors
+            if not session_store.get_session_store().get(rng.choice(session_ids)):
+                return "unresolved"
+    except sqlite3.OperationalError as e:
+        return "database is locked" if "locked" in str(e) else f"OperationalError: {e}"
+    except HashingBusyError:
+        return "hashing busy"
+    return None
+
+
+def _worker(seed, weights, deadline, usernames, session_ids, results):
+    rng = random.Random(seed)
+    ops = list(weights)
+    op_weights = [weights[op] for op in ops]
+    latencies = defaultdict(list)
+    errors = defaultdict(Counter)
+    while time.monotonic() < deadline:
+        op = rng.choices(ops, weights=op_weights)[0]
+        start = time.perf_counter()
+        error = _run_operation(op, rng, usernames, session_ids)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if error:
+            errors[op][error] += 1
+        else:
+            latencies[op].append(elapsed_ms)
+    results.merge(latencies, errors)
+
+
+# Parse "verify_user=1,create_session=1,verify_session=8" into weights
+def _parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        op, _, weight = part.partition("=")
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {op}")
+        weights[op] = float(weight or 1)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="seeded database (see benchmarks.seed)")
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument(
+        "--mix",
+        type=_parse_mix,
+        default="verify_user=1,create_session=1,verify_session=8",
+        help="operation weights",
+    )
+    parser.add_argument("--backend", choices=["sqlite", "shared"], default="sqlite")
+    parser.add_argument(
+        "--write-behind", action="store_true", help="buffer session writes as the app does"
+    )
+    parser.add_argument("--sample", type=int, default=100000, help="users and sessions sampled")
+    args = parser.parse_args()
+
+    db.DB_PATH = args.path
+    db.ensure_db()
+    session_store._store = session_store.build_session_store(
+        args.backend, write_behind=args.write_behind
+    )
+    usernames, session_ids = _load_sample(args.sample)
+    if not usernames or not session_ids:
+        parser.error("the database has no users or sessions; seed it first")
+
+    results = Results()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(i, args.mix, deadline, usernames, session_ids, results),
+        )
+        for i in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    session_store.get_session_store().flush()
+
+    report = {
+        "database": args.path,
+        "threads": args.threads,
+        "duration_s": round(elapsed, 2),
+        "backend": args.backend,
+        "write_behind": args.write_behind,
+        "results": results.summary(elapsed),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Measure rerun latency, SQL query count and peak memory of main.py and the
+built-in pages, driven headlessly with streamlit.testing.v1.AppTest.
+
+Run from the repository root:
+
+    python -m benchmarks.reruns --users 1000 --sessions 5000 --snippets 2000 --output before.json
+
+The JSON report can be compared between commits to catch regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.seed import seed_database
+
+import cookie_manager  # noqa: E402
+import db  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Benchmarked pages: name -> (file_path, page_name), as stored in the pages table
+PAGES = {
+    "dashboard": ("pages/dashboard.py", "Dashboard"),
+    "admin_panel": ("pages/admin_panel.py", "Admin Panel"),
+    "pages_manager": ("pages/pages_manager.py", "Pages Manager"),
+    "code_snippets": ("pages/code_snippets.py", "Code Snippets"),
+    "edit_page_file": ("pages/edit_page_file.py", "Edit Page"),
+}
+
+# Statements counted as queries; PRAGMA, BEGIN, COMMIT and trigger bodies are not
+QUERY_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+# Stand-in for the cookie component, which never becomes ready without a browser
+class BenchCookies(dict):
+    def ready(self):
+        return True
+
+    def save(self):
+        pass
+
+
+# Counts the SQL statements run on every connection opened by db
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        if statement.lstrip()[:7].upper().startswith(QUERY_VERBS):
+            self.count += 1
+
+    def install(self):
+        connect = db._connect
+
+        def traced_connect():
+            conn = connect()
+            conn.set_trace_callback(self)
+            return conn
+
+        # Connections already in the pool would not be traced
+        db.close_connections()
+        db._connect = traced_connect
+
+
+# AppTest script rendering one page function with an authenticated admin.
+# AppTest runs the function's source as a script, so it imports what it needs.
+def _page_script(file_path, page_name, session_id):
+    from auth import begin_request
+    from benchmarks.reruns import BenchCookies
+    from page_registry import get_page_function
+
+    begin_request()
+    get_page_function(file_path, page_name)(BenchCookies(session_id=session_id))
+
+
+# Rerun an app runs times; returns the timings and query count of the warm runs
+def _bench_app(app, counter, runs, timeout):
+    start = time.perf_counter()
+    app.run(timeout=timeout)
+    cold_ms = (time.perf_counter() - start) * 1000
+    timings = []
+    queries_before = counter.count
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run(timeout=timeout)
+        timings.append((time.perf_counter() - start) * 1000)
+    queries = counter.count - queries_before
+
+    # Separate run for memory, since tracing slows the script down
+    tracemalloc.start()
+    app.run(timeout=timeout)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "cold_ms": round(cold_ms, 2),
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "queries_per_run": round(queries / runs, 1),
+        "peak_memory_kb": round(peak / 1024),
+        "exceptions": [e.message for e in app.exception],
+    }
+
+
+# Current git commit, if the tree is a git checkout
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--snippets", type=int, default=100)
+    parser.add_argument("--icons", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=20, help="warm reruns per page")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds per rerun")
+    parser.add_argument("--only", nargs="*", choices=["main", *PAGES], help="targets to run")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Pages read files relative to the repository root
+    os.chdir(ROOT)
+    dataset = {
+        "users": args.users,
+        "sessions": args.sessions,
+        "pages": args.pages,
+        "snippets": args.snippets,
+        "icons": args.icons,
+    }
+    targets = args.only or ["main", *PAGES]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        session_id = seed_database(os.path.join(tmp, "bench.db"), **dataset)
+        counter = QueryCounter()
+        counter.install()
+        # main.py looks up the cookie manager on every run
+        cookie_manager.get_cookie_manager = lambda: BenchCookies(session_id=session_id)
+
+        for target in targets:
+            if target == "main":
+                app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=args.timeout)
+            else:
+                file_path, page_name = PAGES[target]
+                app = AppTest.from_function(
+                    _page_script, args=(file_path, page_name, session_id), default_timeout=args.timeout
+                )
+            results[target] = _bench_app(app, counter, args.runs, args.timeout)
+        db.close_connections()
+
+    report = {"commit": _git_commit(), "dataset": dataset, "runs": args.runs, "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Seed a users.db-compatible database with synthetic data for benchmarks.
+
+Run from the repository root to create a database file, e.g.
+
+    python -m benchmarks.seed bench.db --users 100000 --sessions 1000000 --snippets 10000
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+
+# Cheap hashes for seeded users; must be set before hashing is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import db  # noqa: E402
+from hashing import hash_password  # noqa: E402
+from snippet_codec import REVISION_SNAPSHOT, encode_code, encode_snapshot  # noqa: E402
+
+# Password of every seeded user
+SEED_PASSWORD = "password"
+# Session id of the seeded admin session used to drive authenticated pages
+ADMIN_SESSION_ID = "benchmark-admin-session"
+# Rows written per transaction
+BATCH_SIZE = 50000
+
+_SNIPPET_LINE = "    value_{i} = compute(value_{j}, {k})  # step {i}\n"
+
+
+# Name of the i-th seeded user
+def seed_username(i):
+    return f"user{i:06d}"
+
+
+# Python-looking code of roughly the given number of lines
+def _fake_code(rng, lines):
+    body = "".join(
+        _SNIPPET_LINE.format(i=i, j=max(0, i - 1), k=rng.randint(0, 999)) for i in range(lines)
+    )
+    return f"def snippet_{rng.randint(0, 10**6)}():\n{body}    return value_{lines - 1}\n"
+
+
+# Run executemany over rows in transactions of BATCH_SIZE rows
+def _insert_batches(conn, query, rows):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        conn.executemany(query, batch)
+        conn.commit()
+
+
+def _user_rows(users, hashed):
+    for i in range(users):
+        yield seed_username(i), hashed
+
+
+def _role_rows(users):
+    for i in range(users):
+        yield seed_username(i), "user"
+        # Every tenth user may also manage pages
+        if i % 10 == 0:
+            yield seed_username(i), "pages"
+
+
+# Sessions of random users, all live for another 1 to 12 hours
+def _session_rows(rng, users, sessions):
+    now = datetime.now()
+    for _ in range(sessions):
+        expiry = now + timedelta(minutes=rng.randint(60, 720))
+        yield str(uuid.UUID(int=rng.getrandbits(128), version=4)), seed_username(rng.randrange(users)), expiry
+
+
+def _snippet_rows(rng, snippets):
+    for i in range(snippets):
+        code = _fake_code(rng, rng.choice([5, 20, 80, 300]))
+        stored, codec, size = encode_code(code)
+        yield i + 1, f"Snippet {i}", f"Benchmark snippet number {i}", stored, codec, size, code
+
+
+# Create a fresh database at path and fill it. Existing files are replaced.
+# Returns the session id of a logged-in admin.
+def seed_database(path, users=100, sessions=200, pages=10, snippets=100, icons=20, seed=0):
+    rng = random.Random(seed)
+    db.close_connections()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.DB_PATH = path
+    db.init_db()
+
+    # One hash shared by every user keeps seeding fast
+    hashed = hash_password(SEED_PASSWORD)
+    expiry = datetime.now() + timedelta(hours=12)
+    with db.get_connection() as conn:
+        _insert_batches(conn, "INSERT INTO users (username, password) VALUES (?, ?)", _user_rows(users, hashed))
+        _insert_batches(conn, "INSERT INTO user_roles (username, role) VALUES (?, ?)", _role_rows(users))
+        conn.execute(
+            "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
+            (ADMIN_SESSION_ID, "admin", expiry),
+        )
+        if users:
+            _insert_batches(
+                conn,
+                "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
+                _session_rows(rng, users, sessions),
+            )
+        conn.executemany(
+            "INSERT OR IGNORE INTO icons (icon, icon_order) VALUES (?, ?)",
+            [(f"icon-{i}", 100 + i) for i in range(icons)],
+        )
+        # Extra pages reuse the dashboard file so navigation stays loadable
+        conn.executemany(
+            "INSERT INTO pages (page_name, required_role, icon, enabled, file_path, menu_order) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (f"Bench Page {i}", rng.choice(["user", "pages", "admin"]), "📊", 1, "pages/dashboard.py", 100 + i)
+                for i in range(pages)
+            ],
+        )
+        conn.commit()
+
+        # Snippets get ids 1..n on the fresh table, so revisions can refer to them
+        rows = _snippet_rows(rng, snippets)
+        while True:
+            batch = list(islice(rows, BATCH_SIZE // 10))
+            if not batch:
+                break
+            conn.executemany(
+                """INSERT INTO code_snippets (id, title, description, code, code_codec, code_size, created_by)
+                VALUES (?, ?, ?, ?, ?, ?, 'admin')""",
+                [row[:6] for row in batch],
+            )
+            db.index_snippets(conn, [(row[0], row[1], row[2], row[6]) for row in batch])
+            conn.executemany(
+                """INSERT INTO code_snippet_revisions (snippet_id, revision, kind, data, code_size, created_by)
+                VALUES (?, 1, ?, ?, ?, 'admin')""",
+                [(row[0], REVISION_SNAPSHOT, encode_snapshot(row[6]), row[5]) for row in batch],
+            )
+            conn.commit()
+    return ADMIN_SESSION_ID
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="database file to create (replaced if it exists)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--snippets", type=int, default=1000)
+    parser.add_argument("--icons", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed_database(
+        args.path,
+        users=args.users,
+        sessions=args.sessions,
+        pages=args.pages,
+        snippets=args.snippets,
+        icons=args.icons,
+        seed=args.seed,
+    )
+    db.close_connections()
+    print(f"Seeded {args.path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compare session lookup latency of the session store backends.
+
+Run from the repository root:
+
+    python -m benchmarks.session_store --sessions 10000 --lookups 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Cheap hashes for the seeded admin user; must be set before db is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import db  # noqa: E402
+import session_store  # noqa: E402
+
+
+# Fill a fresh database with sessions spread over a few hundred users
+def seed(session_count, user_count=500):
+    users = [f"user{i}" for i in range(user_count)]
+    expiry = datetime.now() + timedelta(hours=12)
+    session_ids = [str(uuid.uuid4()) for _ in range(session_count)]
+    with db.get_connection() as conn:
+        c = conn.cursor()
+        c.executemany(
+            "INSERT INTO users (username, password) VALUES (?, 'x')", [(u,) for u in users]
+        )
+        c.executemany(
+            "INSERT INTO user_roles (username, role) VALUES (?, 'user')", [(u,) for u in users]
+        )
+        c.executemany(
+            "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
+            [(sid, users[i % user_count], expiry) for i, sid in enumerate(session_ids)],
+        )
+        conn.commit()
+    return session_ids
+
+
+# Time every lookup of keys against store; returns latency percentiles in microseconds
+def measure(store, keys):
+    # One pass to fill the caches, as a running server would have
+    for key in set(keys):
+        store.get(key)
+    timings = []
+    for key in keys:
+        start = time.perf_counter()
+        store.get(key)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "p50_us": round(statistics.median(timings), 1),
+        "p95_us": round(timings[int(len(timings) * 0.95)], 1),
+        "p99_us": round(timings[int(len(timings) * 0.99)], 1),
+        "lookups_per_s": round(len(timings) / (sum(timings) / 1e6)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=50000)
+    parser.add_argument(
+        "--active", type=int, default=1000, help="number of distinct sessions looked up"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.ensure_db()
+        session_ids = seed(args.sessions)
+        active = random.sample(session_ids, min(args.active, len(session_ids)))
+        keys = [random.choice(active) for _ in range(args.lookups)]
+
+        stores = {
+            "sqlite": session_store.SQLiteSessionStore(),
+            "lru+sqlite": session_store.CachedSessionStore(session_store.SQLiteSessionStore()),
+        }
+        try:
+            stores["shared+sqlite"] = session_store.SharedMemorySessionStore(
+                session_store.SQLiteSessionStore(), name=f"bench_sessions_{os.getpid()}"
+            )
+        except ImportError:
+            # No fcntl (non-POSIX system)
+            pass
+
+        results = {}
+        for name, store in stores.items():
+            results[name] = measure(store, keys)
+            if isinstance(store, session_store.SharedMemorySessionStore):
+                store.close()
+                store.unlink()
+        db.close_connections()
+
+    print(json.dumps({"sessions": args.sessions, "lookups": args.lookups, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import logging
+import os
+from functools import lru_cache
+
+import streamlit as st
+from cryptography.fernet import Fernet
+from streamlit_cookies_manager import EncryptedCookieManager
+from streamlit_cookies_manager.encrypted_cookie_manager import key_from_parameters
+
+# Prefix of every cookie set by the app
+COOKIE_PREFIX = "myapp/cookies/"
+# Password used before it became configurable; kept as the fallback so
+# existing cookies stay readable
+LEGACY_COOKIE_PASSWORD = "your-secure-password-here"
+# Number of derived keys kept per process (one per browser key salt)
+KEY_CACHE_SIZE = 1024
+
+logger = logging.getLogger(__name__)
+
+
+# Cookie encryption password: COOKIE_PASSWORD environment variable, then
+# cookie_password in .streamlit/secrets.toml, then the legacy default
+@lru_cache(maxsize=1)
+def get_cookie_password():
+    password = os.environ.get("COOKIE_PASSWORD")
+    if password:
+        return password
+    # Reading st.secrets without a secrets.toml shows an error box on the page
+    if st.secrets.load_if_toml_exists():
+        password = st.secrets.get("cookie_password")
+        if password:
+            return password
+    logger.warning(
+        "No COOKIE_PASSWORD or cookie_password secret is set; encrypting cookies "
+        "with the legacy default password"
+    )
+    return LEGACY_COOKIE_PASSWORD
+
+
+# Derive the Fernet key for a salt. PBKDF2 runs hundreds of thousands of
+# iterations, so each browser's key is derived once per process.
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _get_fernet(salt, iterations, password):
+    return Fernet(key_from_parameters(salt=salt, iterations=iterations, password=password))
+
+
+# EncryptedCookieManager that reuses derived keys across reruns
+class CachedKeyCookieManager(EncryptedCookieManager):
+    def _setup_fernet(self):
+        if self._fernet is not None:
+            return
+        key_params = self._get_key_params()
+        if not key_params:
+            key_params = self._initialize_new_key_params()
+        salt, iterations, _magic = key_params
+        self._fernet = _get_fernet(salt, iterations, self._password)
+
+
+# Build the cookie manager for the current run
+def get_cookie_manager():
+    return CachedKeyCookieManager(prefix=COOKIE_PREFIX, password=get_cookie_password())
@@ -1,7 +1,24 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-import bcrypt
+import sql_trace
+from hashing import get_rounds, hash_password
+from snippet_codec import REVISION_SNAPSHOT, decode_code, encode_code, encode_snapshot
+
+# Path of the SQLite database file
+DB_PATH = "users.db"
+
+# Connection tuning, applied once when a pooled connection is opened
+POOL_SIZE = 8
+CACHED_STATEMENTS = 256
+BUSY_TIMEOUT_MS = 5000
+
+# Separator used when aggregating roles with GROUP_CONCAT
+ROLE_SEPARATOR = "\x1f"
 
 
 # Adapter: Convert datetime object to ISO format string for SQLite storage
@@ -19,9 +36,90 @@ sqlite3.register_adapter(datetime, adapt_datetime)
 sqlite3.register_converter("TIMESTAMP", convert_datetime)
 
 
-# Initialize the database and create tables if they do not exist
+# Idle connections ready to be reused; bounded to POOL_SIZE
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+_init_lock = threading.Lock()
+_db_ready = False
+
+
+# Open a new connection with WAL journaling and the tuned pragmas
+def _connect():
+    conn = sqlite3.connect(
+        DB_PATH,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        cached_statements=CACHED_STATEMENTS,
+        check_same_thread=False,
+        factory=sql_trace.TracedConnection,
+    )
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+# Borrow a pooled connection for the duration of a with-block.
+# Uncommitted work is rolled back before the connection is returned to the pool.
+@contextmanager
+def get_connection():
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _connect()
+    sql_trace.attach(conn)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+# Close every idle pooled connection (e.g. before the database file is replaced)
+def close_connections():
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+# Split a GROUP_CONCAT'ed role list back into a sorted list of roles
+def split_roles(value):
+    return sorted(value.split(ROLE_SEPARATOR)) if value else []
+
+
+# Initialize the database, create tables if they do not exist and migrate
 def init_db():
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
+    with get_connection() as conn:
+        _create_schema(conn)
+        migrate(conn)
+
+
+# Create the database if it is missing, otherwise bring its schema up to
+# date. Runs once per process; later calls return immediately.
+def ensure_db():
+    global _db_ready
+    if _db_ready:
+        return
+    with _init_lock:
+        if _db_ready:
+            return
+        # Calibrate the bcrypt cost now rather than inside the first login
+        get_rounds()
+        if not os.path.exists(DB_PATH):
+            init_db()
+        else:
+            with get_connection() as conn:
+                migrate(conn)
+        _db_ready = True
+
+
+# Create tables and default rows on the given connection
+def _create_schema(conn):
     c = conn.cursor()
     
     # Create users table
@@ -127,7 +225,7 @@ def init_db():
     # Create admin user with password '1234' if it doesn't exist
     c.execute("SELECT COUNT(*) FROM users WHERE username = ?", ("admin",))
     if c.fetchone()[0] == 0:
-        hashed = bcrypt.hashpw("1234".encode(), bcrypt.gensalt())
+        hashed = hash_password("1234")
         c.execute("INSERT INTO users (username, password) VALUES (?, ?)", ("admin", hashed))
         
         # Assign admin role to admin user if not already assigned
@@ -136,4 +234,158 @@ def init_db():
             c.execute("INSERT INTO user_roles (username, role) VALUES (?, ?)", ("admin", "admin"))
     
     conn.commit()
-    conn.close()
+
+
+# Migration 1: secondary indexes for the hot lookups
+def _migration_1_indexes(c):
+    # (expiry, session_id) serves the purge and keyset browsing of sessions,
+    # (username, expiry) per-user lookups and filtering
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiry_id ON sessions(expiry, session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_username_expiry ON sessions(username, expiry)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_roles_role ON user_roles(role)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pages_enabled_order ON pages(enabled, menu_order)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pages_required_role ON pages(required_role)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pages_icon ON pages(icon)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_code_snippets_updated_at ON code_snippets(updated_at)")
+
+
+# Migration 2: persisted login lockouts of the login throttler
+def _migration_2_login_lockouts(c):
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS login_lockouts (
+            key TEXT PRIMARY KEY,
+            locked_until TIMESTAMP
+        )"""
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_lockouts_until ON login_lockouts(locked_until)")
+
+
+# Add snippets to the full-text index. rows are (id, title, description, code)
+# with the code decoded; the index is contentless, so it is written from Python
+# rather than by triggers, which could not decompress the code.
+def index_snippets(c, rows):
+    c.executemany(
+        "INSERT INTO code_snippets_fts (rowid, title, description, code) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+# Remove snippets from the full-text index. rows must hold exactly the values
+# that were indexed, as a contentless index cannot look them up itself.
+def unindex_snippets(c, rows):
+    c.executemany(
+        """INSERT INTO code_snippets_fts (code_snippets_fts, rowid, title, description, code)
+        VALUES ('delete', ?, ?, ?, ?)""",
+        rows,
+    )
+
+
+# Migration 3: FTS5 full-text index over code snippets. The index stores no
+# content and is kept in sync by the snippet functions (see index_snippets).
+def _migration_3_snippet_search(c):
+    c.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS code_snippets_fts USING fts5(
+            title, description, code,
+            content='', prefix='2 3'
+        )"""
+    )
+    c.execute("SELECT id, title, description, code FROM code_snippets")
+    index_snippets(c, c.fetchall())
+
+
+def _migration_4_snippet_compression(c):
+    c.execute("ALTER TABLE code_snippets ADD COLUMN code_codec TEXT NOT NULL DEFAULT 'plain'")
+    c.execute("ALTER TABLE code_snippets ADD COLUMN code_size INTEGER")
+
+    # Compress existing bodies above the threshold and record every raw size.
+    # The search index holds the decoded text, so it is unaffected.
+    c.execute("SELECT id, code FROM code_snippets")
+    updates = [(*encode_code(code), snippet_id) for snippet_id, code in c.fetchall()]
+    c.executemany(
+        "UPDATE code_snippets SET code = ?, code_codec = ?, code_size = ? WHERE id = ?",
+        updates,
+    )
+
+
+def _migration_5_snippet_revisions(c):
+    # One row per saved version of a snippet: a compressed snapshot or a
+    # delta against the previous revision
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS code_snippet_revisions (
+            snippet_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            data BLOB NOT NULL,
+            code_size INTEGER NOT NULL,
+            created_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (snippet_id, revision)
+        )"""
+    )
+    # Existing snippets start their history with a snapshot of the current code
+    c.execute("SELECT id, code_codec, code, created_by, updated_at FROM code_snippets")
+    revisions = []
+    for snippet_id, codec, stored, created_by, updated_at in c.fetchall():
+        code = decode_code(codec, stored)
+        revisions.append(
+            (snippet_id, REVISION_SNAPSHOT, encode_snapshot(code), len(code.encode("utf-8")), created_by, updated_at)
+        )
+    c.executemany(
+        """INSERT OR IGNORE INTO code_snippet_revisions
+            (snippet_id, revision, kind, data, code_size, created_by, created_at)
+            VALUES (?, 1, ?, ?, ?, ?, ?)""",
+        revisions,
+    )
+
+
+# Migration 6: change counter of the pages table, bumped by triggers so every
+# process can tell when its cached navigation is stale
+def _migration_6_pages_generation(c):
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS pages_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )"""
+    )
+    c.execute("INSERT OR IGNORE INTO pages_generation (id, generation) VALUES (1, 0)")
+    for event in ("insert", "update", "delete"):
+        c.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS pages_generation_{event} AFTER {event.upper()} ON pages BEGIN
+                UPDATE pages_generation SET generation = generation + 1 WHERE id = 1;
+            END"""
+        )
+
+
+# Schema migrations as (version, function) pairs, in order. PRAGMA user_version
+# stores the last version applied; append new migrations, never edit old ones.
+MIGRATIONS = [
+    (1, _migration_1_indexes),
+    (2, _migration_2_login_lockouts),
+    (3, _migration_3_snippet_search),
+    (4, _migration_4_snippet_compression),
+    (5, _migration_5_snippet_revisions),
+    (6, _migration_6_pages_generation),
+]
+
+
+# Apply every migration newer than the database's user_version, each in its
+# own transaction. The version is re-read under the write lock, so processes
+# starting at the same time apply each migration only once.
+def migrate(conn):
+    c = conn.cursor()
+    c.execute("PRAGMA user_version")
+    if c.fetchone()[0] >= MIGRATIONS[-1][0]:
+        return
+    for target, migration in MIGRATIONS:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("PRAGMA user_version")
+            if c.fetchone()[0] >= target:
+                conn.rollback()
+                continue
+            migration(c)
+            c.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
@@ -0,0 +1,15 @@
+import streamlit as st
+
+# session_state key holding the messages queued for the next script run
+FLASH_KEY = "_flash_messages"
+
+
+# Queue a toast that is shown on the next script run, so it survives st.rerun()
+def flash(message, icon=None):
+    st.session_state.setdefault(FLASH_KEY, []).append((message, icon))
+
+
+# Show and clear the pending flash messages; called once at the start of each run
+def show_flashes():
+    for message, icon in st.session_state.pop(FLASH_KEY, []):
+        st.toast(message, icon=icon)
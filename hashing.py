@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+# Maximum number of bcrypt operations running at the same time
+MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Maximum number of operations queued or running before new ones are rejected
+MAX_QUEUE = 32
+# Seconds a caller waits for its result before giving up
+RESULT_TIMEOUT = 10
+
+# Target duration of one bcrypt verification, used to calibrate the cost factor
+TARGET_HASH_MS = int(os.environ.get("BCRYPT_TARGET_MS", "100"))
+# Fixed cost factor; skips calibration when set, and is the only way to
+# lower the cost of existing hashes
+ROUNDS_OVERRIDE = int(os.environ.get("BCRYPT_ROUNDS", "0")) or None
+# Bounds for the calibrated cost factor; never below bcrypt's default of 12
+MIN_ROUNDS = 12
+MAX_ROUNDS = 16
+
+
+# Raised when the hashing queue is full or a result takes too long
+class HashingBusyError(RuntimeError):
+    pass
+
+
+# bcrypt releases the GIL, so worker threads hash in parallel with the
+# Streamlit script threads instead of stalling them
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(MAX_QUEUE)
+_stats_lock = threading.Lock()
+_stats = {"queue_depth": 0, "peak_queue_depth": 0, "completed": 0, "rejected": 0}
+_rounds_lock = threading.Lock()
+_rounds = None
+
+
+# Mark a queued operation as finished and free its queue slot
+def _release(_future):
+    with _stats_lock:
+        _stats["queue_depth"] -= 1
+        _stats["completed"] += 1
+    _slots.release()
+
+
+# Run func on the worker pool and wait for its result
+def _run(func, *args):
+    if not _slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats["rejected"] += 1
+        raise HashingBusyError("Too many password operations in progress.")
+    with _stats_lock:
+        _stats["queue_depth"] += 1
+        _stats["peak_queue_depth"] = max(
+            _stats["peak_queue_depth"], _stats["queue_depth"]
+        )
+    future = _executor.submit(func, *args)
+    future.add_done_callback(_release)
+    try:
+        return future.result(timeout=RESULT_TIMEOUT)
+    except FutureTimeoutError:
+        raise HashingBusyError("Password operation timed out.")
+
+
+# Find the highest cost factor whose hash time stays within target_ms, but at
+# least MIN_ROUNDS. Each extra round doubles the work, so one measurement is enough.
+def calibrate_rounds(target_ms=TARGET_HASH_MS):
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(MIN_ROUNDS))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    rounds = MIN_ROUNDS
+    while rounds < MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    return rounds
+
+
+# Cost factor for new hashes: the override if configured, otherwise
+# calibrated once per process (db.ensure_db() does this at startup)
+def get_rounds():
+    global _rounds
+    if _rounds is None:
+        with _rounds_lock:
+            if _rounds is None:
+                _rounds = ROUNDS_OVERRIDE or calibrate_rounds()
+    return _rounds
+
+
+# Read the cost factor from a bcrypt hash such as b"$2b$12$..."
+def get_cost(hashed):
+    if isinstance(hashed, str):
+        hashed = hashed.encode()
+    try:
+        return int(hashed.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+# Check whether a stored hash should be rewritten at the current cost. Hashes
+# are only strengthened, unless BCRYPT_ROUNDS explicitly asks for a lower cost.
+def needs_rehash(hashed):
+    cost = get_cost(hashed)
+    if cost is None:
+        return True
+    if ROUNDS_OVERRIDE:
+        return cost != ROUNDS_OVERRIDE
+    return cost < get_rounds()
+
+
+# Hash a password with a fresh salt at the current cost factor
+def hash_password(password):
+    return _run(bcrypt.hashpw, password.encode(), bcrypt.gensalt(get_rounds()))
+
+
+# Check a password against a stored bcrypt hash
+def check_password(password, hashed):
+    return _run(bcrypt.checkpw, password.encode(), hashed)
+
+
+# Snapshot of the hashing pool counters
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["max_workers"] = MAX_WORKERS
+    stats["max_queue"] = MAX_QUEUE
+    stats["rounds"] = _rounds
+    return stats
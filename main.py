@@ -1,65 +1,24 @@
-import importlib.util
-import os
-import sqlite3
-import sys
-
 import streamlit as st
-from streamlit_cookies_manager import EncryptedCookieManager
 
 import pages.login as login_mod
-from auth import clear_session, verify_session
-from db import init_db
+from auth import begin_request, clear_session, verify_session
+from cookie_manager import get_cookie_manager
+from db import ensure_db, get_connection
+from flash import show_flashes
+from page_registry import can_access, get_navigation, get_page_function
 from pages.register import register_page
-
-
-# Helper to get required role for a page
-def get_required_role(page_name):
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT required_role FROM pages WHERE page_name = ?", (page_name,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else None
+from sql_trace import begin_run, end_run, tag_run
 
 
 # Helper to get all enabled pages from the database
 def get_enabled_pages():
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT page_name, icon, file_path FROM page_roles WHERE enabled = 1")
-    pages = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT page_name, icon, file_path FROM page_roles WHERE enabled = 1")
+        pages = c.fetchall()
     return pages
 
 
-# Helper to get all enabled pages with roles from the database
-def get_enabled_pages_with_roles():
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute(
-        "SELECT page_name, icon, file_path, required_role FROM pages WHERE enabled = 1 ORDER BY menu_order, page_name"
-    )
-    pages = c.fetchall()
-    conn.close()
-    return pages
-
-
-# Helper to dynamically import a page function from a file
-def import_page_function(file_path, page_name):
-    module_name = os.path.splitext(os.path.basename(file_path))[0]
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
-    if spec is None or spec.loader is None:
-        return None
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[module_name] = module
-    try:
-        spec.loader.exec_module(module)
-    except Exception:
-        return None
-    func_name = f"{page_name.lower().replace(' ', '_')}_page"
-    return getattr(module, func_name, None)
-
-
 # Main entry point for the Streamlit app
 
 
@@ -79,59 +38,60 @@ def main():
         """,
         unsafe_allow_html=True,
     )
-    # Initialize the database only if it doesn't exist
-    if not os.path.exists("users.db"):
-        init_db()
+    # Show toasts queued by the previous run before it called st.rerun()
+    show_flashes()
 
-    # Set up encrypted cookies manager for session handling
-    cookies = EncryptedCookieManager(
-        prefix="myapp/cookies/", password="your-secure-password-here"
-    )
+    # Create the database if needed and apply pending migrations (once per process)
+    ensure_db()
+
+    # Set up encrypted cookies manager for session handling. The password
+    # comes from configuration and derived keys are cached per process.
+    cookies = get_cookie_manager()
     if not cookies.ready():
         st.stop()
 
     def login_page():
         login_mod.login_page(cookies)
 
-    # Check if user is logged in and get their role(s)
+    # Check if user is logged in and get their role(s). This resolves the
+    # auth context for the whole run; pages reuse it via verify_session.
+    begin_request()
+    begin_run()
     username, roles = verify_session(cookies)
+    tag_run(user=username)
 
-    # Dynamically load enabled pages the user has access to
-    enabled_pages = get_enabled_pages_with_roles()
+    # Build navigation for the enabled pages the user has access to. The
+    # role-filtered page list is cached until pages change in any process.
     page_objs = []
-    for page_name, icon, file_path, required_role in enabled_pages:
+    for page_name, icon, file_path, required_role in get_navigation(roles):
         # Skip login/register, handled separately
         if page_name in ("Login", "Register"):
             continue
-        # Only show if user has the required role, or is admin
-        if required_role and (
-            roles is None or (required_role not in roles and "admin" not in roles)
-        ):
-            continue
-        # Import the page function
-        page_func = import_page_function(file_path, page_name)
-        if page_func is None:
-            continue
-
-        # Wrap with access control and unique function name
-        def make_page_func(page_func, page_name):
-            def wrapped_page(page_func=page_func, page_name=page_name):
-                required_role = get_required_role(page_name)
+        # Wrap with access control and unique function name. The page module
+        # is only imported when navigation dispatches to this page.
+        def make_page_func(file_path, page_name, required_role):
+            def wrapped_page(
+                file_path=file_path, page_name=page_name, required_role=required_role
+            ):
                 _, user_roles = verify_session(cookies)
-                if required_role and (
-                    required_role not in user_roles and "admin" not in user_roles
-                ):
+                if not can_access(required_role, user_roles):
                     st.error(
                         f"Access denied: {required_role.capitalize()} role required."
                     )
                     st.stop()
+                page_func = get_page_function(file_path, page_name)
+                if page_func is None:
+                    st.error(f"Page '{page_name}' could not be loaded.")
+                    st.stop()
                 page_func(cookies)
 
             wrapped_page.__name__ = f"{page_name.lower().replace(' ', '_')}"
             return wrapped_page
 
         page_obj = st.Page(
-            make_page_func(page_func, page_name), title=page_name, icon=icon
+            make_page_func(file_path, page_name, required_role),
+            title=page_name,
+            icon=icon,
         )
         page_objs.append(page_obj)
 
@@ -155,7 +115,11 @@ def main():
 
     # Set up and run navigation
     navigation = st.navigation(pages)
-    navigation.run()
+    tag_run(page=navigation.title)
+    try:
+        navigation.run()
+    finally:
+        end_run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import hashlib
+import importlib.util
+import os
+import sys
+import threading
+
+from db import get_connection
+
+# Prefix for the sys.modules entries of dynamically loaded pages
+MODULE_PREFIX = "app_page__"
+
+# file_path -> (mtime, content hash, module) for every loaded page
+_modules = {}
+_lock = threading.RLock()
+
+# Navigation cache: bumped by every page or role mutation
+_nav_generation = 0
+# pages_generation of the database the cache was built from. Triggers bump it
+# on every change to pages, including those made by other processes.
+_nav_db_generation = None
+# Enabled pages as (page_name, icon, file_path, required_role), in menu order
+_nav_pages = None
+# frozenset of roles -> visible subset of _nav_pages
+_nav_by_roles = {}
+
+
+# Build a sys.modules name that is unique per page file
+def _module_name(file_path):
+    stem = os.path.splitext(os.path.normpath(file_path))[0]
+    return MODULE_PREFIX + "".join(ch if ch.isalnum() else "_" for ch in stem)
+
+
+# Hash the source of a page file
+def _file_hash(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# Execute a page file in its own module namespace
+def _exec_module(file_path):
+    module_name = _module_name(file_path)
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    if spec is None or spec.loader is None:
+        return None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        sys.modules.pop(module_name, None)
+        return None
+    return module
+
+
+# Return the module for a page file, re-importing only if the file changed
+def load_page_module(file_path):
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except OSError:
+        unload_page(file_path)
+        return None
+    with _lock:
+        cached = _modules.get(file_path)
+        if cached and cached[0] == mtime:
+            return cached[2]
+        digest = _file_hash(file_path)
+        if cached and cached[1] == digest:
+            # Touched but unchanged: keep the module, remember the new mtime
+            _modules[file_path] = (mtime, digest, cached[2])
+            return cached[2]
+        module = _exec_module(file_path)
+        if module is None:
+            _modules.pop(file_path, None)
+            return None
+        _modules[file_path] = (mtime, digest, module)
+        return module
+
+
+# Look up the <page_name>_page function of a page file
+def get_page_function(file_path, page_name):
+    module = load_page_module(file_path)
+    if module is None:
+        return None
+    func_name = f"{page_name.lower().replace(' ', '_')}_page"
+    return getattr(module, func_name, None)
+
+
+# Forget a page module, e.g. after its page was deleted or renamed
+def unload_page(file_path):
+    with _lock:
+        _modules.pop(file_path, None)
+        sys.modules.pop(_module_name(file_path), None)
+
+
+# Helper to get all enabled pages with roles from the database
+def _load_enabled_pages():
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT page_name, icon, file_path, required_role FROM pages WHERE enabled = 1 ORDER BY menu_order, page_name"
+        )
+        return c.fetchall()
+
+
+# Read the database's change counter of the pages table
+def _load_pages_generation():
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT generation FROM pages_generation WHERE id = 1")
+        row = c.fetchone()
+    return row[0] if row else None
+
+
+# Check whether a set of roles may open a page requiring required_role
+def can_access(required_role, roles):
+    return not required_role or required_role in roles or "admin" in roles
+
+
+# Return the enabled pages visible to the given roles, in menu order.
+# Results are cached per role set until invalidate_navigation() is called or
+# the pages table changes in any process, which is checked on every call.
+def get_navigation(roles):
+    global _nav_pages, _nav_db_generation
+    key = frozenset(roles or ())
+    db_generation = _load_pages_generation()
+    with _lock:
+        if db_generation != _nav_db_generation:
+            _clear_navigation()
+            _nav_db_generation = db_generation
+        visible = _nav_by_roles.get(key)
+        if visible is not None:
+            return visible
+        generation = _nav_generation
+        pages = _nav_pages
+    if pages is None:
+        pages = _load_enabled_pages()
+    visible = [page for page in pages if can_access(page[3], key)]
+    with _lock:
+        # Drop the result if the pages changed while it was being built
+        if generation == _nav_generation:
+            _nav_pages = pages
+            _nav_by_roles[key] = visible
+    return visible
+
+
+# Drop the cached navigation; the caller holds _lock
+def _clear_navigation():
+    global _nav_generation, _nav_pages
+    _nav_generation += 1
+    _nav_pages = None
+    _nav_by_roles.clear()
+
+
+# Invalidate the navigation cache after pages or roles were changed
+def invalidate_navigation():
+    with _lock:
+        _clear_navigation()
@@ -1,10 +1,22 @@
 import sqlite3
-import time
-import bcrypt
+from datetime import datetime, timedelta
 import streamlit as st
 import streamlit_sortables as sortables
 
 from auth import verify_session
+from db import ROLE_SEPARATOR, get_connection, split_roles
+from flash import flash
+from hashing import HashingBusyError, hash_password
+from hashing import get_stats as get_hashing_stats
+from page_registry import invalidate_navigation
+from session_store import get_session_store
+from snippet_codec import COMPRESS_THRESHOLD
+import sql_trace
+from throttle import clear_lockout, get_lockouts
+from throttle import get_stats as get_throttle_stats
+
+# Page sizes offered by the paginated admin tables
+PAGE_SIZES = [25, 50, 100, 250]
 
 
 # Admin panel page for managing users and sessions
@@ -23,35 +35,49 @@ def admin_panel_page(cookies):
             st.write(f"Welcome to the Admin Panel, {username}!")
             st.write("This page is only accessible to users with the 'admin' role.")
 
-            # Fetch all users from the database
-            conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-            c = conn.cursor()
-            c.execute("SELECT username FROM users ORDER BY LOWER(username) ASC")
-            users = [(row[0],) for row in c.fetchall()]
-            conn.close()
-
             # Create tabs for each admin section
             tabs = st.tabs([
                 "Manage Users",
                 "Manage Sessions",
                 "Manage Roles",
-                "Manage Icons"
+                "Manage Icons",
+                "Login Throttling",
+                "Snippet Storage",
+                "Performance",
             ])
 
             # Users tab
             with tabs[0]:
                 st.subheader("Users")
                 # Search functionality for users (moved into this tab)
-                search_query = st.text_input(
-                    "Search users by username", "", key="user_search"
+                col_search, col_size, col_page = st.columns([4, 1, 1])
+                with col_search:
+                    search_query = st.text_input(
+                        "Search users by username", "", key="user_search"
+                    )
+                with col_size:
+                    page_size = st.selectbox(
+                        "Users per page", PAGE_SIZES, key="user_page_size"
+                    )
+                # Searching or resizing starts again from the first page
+                if st.session_state.get("_user_page_filter") != (search_query, page_size):
+                    st.session_state["_user_page_filter"] = (search_query, page_size)
+                    st.session_state["user_page"] = 1
+                total_users = count_users(search_query)
+                page_count = max(1, -(-total_users // page_size))
+                if st.session_state.get("user_page", 1) > page_count:
+                    st.session_state["user_page"] = page_count
+                with col_page:
+                    page = st.number_input(
+                        f"Page (of {page_count})",
+                        min_value=1,
+                        max_value=page_count,
+                        key="user_page",
+                    )
+                filtered_users = get_users_with_roles(
+                    search_query, page_size, (page - 1) * page_size
                 )
-                filtered_users = users
-                if search_query:
-                    filtered_users = [
-                        user
-                        for user in users
-                        if search_query.lower() in user[0].lower()
-                    ]
+                st.caption(f"{total_users} user(s) found.")
                 header1, header2, header4 = st.columns([1, 3, 2])
                 with header1:
                     st.markdown("**Username**")
@@ -60,23 +86,15 @@ def admin_panel_page(cookies):
                 with header4:
                     st.markdown("**Reset Password**")
 
-                all_roles = []
-                # Fetch all roles from the database
-                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                c = conn.cursor()
-                c.execute("SELECT role FROM roles")
-                all_roles = [row[0] for row in c.fetchall()]
-                conn.close()
-                for user in filtered_users:
-                    username = user[0]
+                all_roles = get_roles()
+                for username, user_roles in filtered_users:
                     col1, col2, col4 = st.columns([1, 3, 2])
                     with col1:
                         st.write(username)
                     with col2:
                         if username == "admin":
-                            st.write(", ".join(get_user_roles(username)))
+                            st.write(", ".join(user_roles))
                         else:
-                            user_roles = get_user_roles(username)
                             # Ensure 'user' is always included and cannot be removed
                             roles_for_multiselect = [
                                 r for r in all_roles if r != "user"
@@ -94,8 +112,7 @@ def admin_panel_page(cookies):
                             new_roles.append("user")
                             if set(new_roles) != set(user_roles):
                                 update_user_roles(username, new_roles)
-                                st.toast(f"Roles for {username} updated.", icon="✅")
-                                time.sleep(2)
+                                flash(f"Roles for {username} updated.", icon="✅")
                                 st.rerun()
                     with col4:
                         if username == "admin":
@@ -115,23 +132,21 @@ def admin_panel_page(cookies):
                                 placeholder="Enter new password",
                             )
                             if new_password and not st.session_state.get(pw_key):
-                                hashed = bcrypt.hashpw(
-                                    new_password.encode(), bcrypt.gensalt()
-                                )
-                                conn = sqlite3.connect(
-                                    "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                                )
-                                c = conn.cursor()
-                                c.execute(
-                                    "UPDATE users SET password = ? WHERE username = ?",
-                                    (hashed, username),
-                                )
-                                conn.commit()
-                                conn.close()
+                                try:
+                                    hashed = hash_password(new_password)
+                                except HashingBusyError:
+                                    st.toast("The server is busy. Please try again in a moment.", icon="⏳")
+                                    st.stop()
+                                with get_connection() as conn:
+                                    c = conn.cursor()
+                                    c.execute(
+                                        "UPDATE users SET password = ? WHERE username = ?",
+                                        (hashed, username),
+                                    )
+                                    conn.commit()
                                 st.session_state[pw_key] = True
-                                st.toast(f"Password for {username} updated.", icon="✅")
+                                flash(f"Password for {username} updated.", icon="✅")
                                 st.session_state[clear_pw_key] = True
-                                time.sleep(2)
                                 st.rerun()
                             elif not new_password and st.session_state.get(pw_key):
                                 st.session_state[pw_key] = False
@@ -140,62 +155,117 @@ def admin_panel_page(cookies):
             with tabs[1]:
                 st.subheader("User Sessions")
                 current_session_id = cookies.get("session_id")
-                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                c = conn.cursor()
-                c.execute("SELECT username, session_id, expiry FROM sessions")
-                all_sessions = c.fetchall()
-                conn.close()
+                # Show sessions that are still buffered in the session store
+                get_session_store().flush()
 
-                import datetime
-                from datetime import datetime as dt
+                col_user, col_from, col_to, col_size = st.columns([3, 2, 2, 1])
+                with col_user:
+                    session_user = st.text_input(
+                        "Username starts with", "", key="session_user_filter"
+                    )
+                with col_from:
+                    expiry_from = st.date_input(
+                        "Expires from", value=None, key="session_expiry_from"
+                    )
+                with col_to:
+                    expiry_to = st.date_input(
+                        "Expires until", value=None, key="session_expiry_to"
+                    )
+                with col_size:
+                    session_page_size = st.selectbox(
+                        "Per page", PAGE_SIZES, key="session_page_size"
+                    )
+                session_filter = (session_user.lower().strip(), expiry_from, expiry_to)
+                # A new filter starts browsing again from the first page
+                if st.session_state.get("_session_filter") != (session_filter, session_page_size):
+                    st.session_state["_session_filter"] = (session_filter, session_page_size)
+                    st.session_state["session_cursors"] = []
+                cursors = st.session_state.setdefault("session_cursors", [])
 
-                from dateutil import parser
+                view = st.radio(
+                    "View",
+                    ["Sessions", "Per-user summary"],
+                    horizontal=True,
+                    key="session_view",
+                    label_visibility="collapsed",
+                )
+                st.caption(f"{count_sessions(*session_filter)} session(s) match.")
 
-                col1, col2, col3 = st.columns([3, 3, 2])
-                with col1:
-                    st.markdown("**Username**")
-                with col2:
-                    st.markdown("**Expiry**")
-                with col3:
-                    st.markdown("**Action**")
+                if view == "Per-user summary":
+                    summary = get_session_summary(*session_filter, limit=session_page_size)
+                    st.dataframe(
+                        [
+                            {
+                                "Username": summary_user,
+                                "Sessions": session_count,
+                                "Latest expiry": latest_expiry,
+                            }
+                            for summary_user, session_count, latest_expiry in summary
+                        ],
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+                else:
+                    all_sessions, has_next = get_sessions_page(
+                        *session_filter,
+                        limit=session_page_size,
+                        cursor=cursors[-1] if cursors else None,
+                    )
 
-                for session in all_sessions:
-                    username, session_id, expiry = session
-                    is_current = session_id == current_session_id
                     col1, col2, col3 = st.columns([3, 3, 2])
                     with col1:
-                        label = f"{username}"
-                        if is_current:
-                            label += " (Current Session)"
-                        st.write(label)
+                        st.markdown("**Username**")
                     with col2:
-                        expiry_str = str(expiry)
-                        try:
-                            from dateutil import parser
-
-                            expiry_dt = parser.parse(expiry_str)
-                            expiry_display = expiry_dt.strftime("%d-%m-%Y %H:%M:%S")
-                        except Exception:
-                            expiry_display = expiry_str
-                        st.write(expiry_display)
+                        st.markdown("**Expiry**")
                     with col3:
-                        if not is_current:
-                            if st.button(f"Delete", key=f"del_sess_{session_id}"):
-                                conn = sqlite3.connect(
-                                    "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                                )
-                                c = conn.cursor()
-                                c.execute(
-                                    "DELETE FROM sessions WHERE session_id = ?",
-                                    (session_id,),
-                                )
-                                conn.commit()
-                                conn.close()
-                                st.toast(f"Session {session_id} deleted.", icon="✅")
-                                time.sleep(2)
-                                st.rerun()
-                        else:
-                            st.write("")
+                        st.markdown("**Action**")
+
+                    for session in all_sessions:
+                        username, session_id, expiry = session
+                        is_current = session_id == current_session_id
+                        col1, col2, col3 = st.columns([3, 3, 2])
+                        with col1:
+                            label = f"{username}"
+                            if is_current:
+                                label += " (Current Session)"
+                            st.write(label)
+                        with col2:
+                            st.write(expiry.strftime("%d-%m-%Y %H:%M:%S"))
+                        with col3:
+                            if not is_current:
+                                if st.button(f"Delete", key=f"del_sess_{session_id}"):
+                                    store = get_session_store()
+                                    store.delete(session_id)
+                                    store.flush()
+                                    flash(f"Session {session_id} deleted.", icon="✅")
+                                    st.rerun()
+                            else:
+                                st.write("")
+
+                    col_prev, col_spacer, col_next = st.columns([1, 6, 1])
+                    with col_prev:
+                        if st.button("Previous", key="sessions_prev", disabled=not cursors):
+                            cursors.pop()
+                            st.rerun()
+                    with col_next:
+                        if st.button("Next", key="sessions_next", disabled=not has_next):
+                            last = all_sessions[-1]
+                            cursors.append((last[2], last[1]))
+                            st.rerun()
+
+                with st.expander("Revoke matching sessions"):
+                    st.write(
+                        "Deletes every session matching the filters above, except your current session."
+                    )
+                    confirm_revoke = st.checkbox(
+                        "I understand this signs the matching users out.",
+                        key="confirm_revoke_sessions",
+                    )
+                    if st.button("Revoke", key="revoke_sessions", disabled=not confirm_revoke):
+                        revoked = revoke_sessions(*session_filter, keep_session_id=current_session_id)
+                        st.session_state["session_cursors"] = []
+                        flash(f"{revoked} session(s) revoked.", icon="✅")
+                        st.rerun()
 
             # Manage Roles tab
             with tabs[2]:
@@ -208,17 +278,13 @@ def admin_panel_page(cookies):
                             st.toast("Please enter a role name.", icon="⚠️")
                         elif new_role not in roles:
                             try:
-                                conn = sqlite3.connect(
-                                    "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                                )
-                                c = conn.cursor()
-                                c.execute(
-                                    "INSERT INTO roles (role) VALUES (?)", (new_role,)
-                                )
-                                conn.commit()
-                                conn.close()
-                                st.toast(f"Role '{new_role}' added.", icon="✅")
-                                time.sleep(2)
+                                with get_connection() as conn:
+                                    c = conn.cursor()
+                                    c.execute(
+                                        "INSERT INTO roles (role) VALUES (?)", (new_role,)
+                                    )
+                                    conn.commit()
+                                flash(f"Role '{new_role}' added.", icon="✅")
                                 st.rerun()
                             except sqlite3.IntegrityError:
                                 st.toast(f"Role '{new_role}' already exists.", icon="⚠️")
@@ -233,16 +299,13 @@ def admin_panel_page(cookies):
                     with col2:
                         if r not in ("admin", "user", "pages"):
                             # Check if role is assigned to any page
-                            conn = sqlite3.connect(
-                                "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                            )
-                            c = conn.cursor()
-                            c.execute(
-                                "SELECT COUNT(*) FROM pages WHERE required_role = ?",
-                                (r,),
-                            )
-                            is_assigned = c.fetchone()[0] > 0
-                            conn.close()
+                            with get_connection() as conn:
+                                c = conn.cursor()
+                                c.execute(
+                                    "SELECT COUNT(*) FROM pages WHERE required_role = ?",
+                                    (r,),
+                                )
+                                is_assigned = c.fetchone()[0] > 0
                             if is_assigned:
                                 st.button(
                                     f"Delete",
@@ -252,32 +315,30 @@ def admin_panel_page(cookies):
                                 )
                             else:
                                 if st.button(f"Delete", key=f"del_role_{r}"):
-                                    conn = sqlite3.connect(
-                                        "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                                    )
-                                    c = conn.cursor()
+                                    with get_connection() as conn:
+                                        c = conn.cursor()
 
-                                    # Remove the role from all users first
-                                    c.execute(
-                                        "DELETE FROM user_roles WHERE role = ?", (r,)
-                                    )
+                                        # Remove the role from all users first
+                                        c.execute(
+                                            "DELETE FROM user_roles WHERE role = ?", (r,)
+                                        )
 
-                                    # Delete the role from roles table
-                                    c.execute("DELETE FROM roles WHERE role = ?", (r,))
+                                        # Delete the role from roles table
+                                        c.execute("DELETE FROM roles WHERE role = ?", (r,))
 
-                                    # Clean up orphaned roles in pages - set them to 'user' role
-                                    c.execute(
-                                        "UPDATE pages SET required_role = 'user' WHERE required_role = ?",
-                                        (r,),
-                                    )
+                                        # Clean up orphaned roles in pages - set them to 'user' role
+                                        c.execute(
+                                            "UPDATE pages SET required_role = 'user' WHERE required_role = ?",
+                                            (r,),
+                                        )
 
-                                    conn.commit()
-                                    conn.close()
-                                    st.toast(
+                                        conn.commit()
+                                    invalidate_navigation()
+                                    get_session_store().invalidate()
+                                    flash(
                                         f"Role '{r}' deleted and removed from all users.",
                                         icon="✅",
                                     )
-                                    time.sleep(2)
                                     st.rerun()
                         else:
                             st.write("")
@@ -285,12 +346,10 @@ def admin_panel_page(cookies):
             # Manage Icons tab
             with tabs[3]:
                 st.subheader("Manage Icons")
-                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                c = conn.cursor()
-                c.execute("SELECT icon, icon_order FROM icons ORDER BY icon_order, icon")
-                icons = c.fetchall()
-                conn.close()
-                icon_list = [icon for icon, _ in icons]
+                icons = get_icons_with_usage()
+                icon_list = [icon for icon, _, _ in icons]
+                icon_orders = {icon: icon_order for icon, icon_order, _ in icons}
+                icon_usage = {icon: usage for icon, _, usage in icons}
                 st.write("**Available Icons:** (drag to reorder)")
                 # Drag-and-drop reorder UI
                 sortable_key = f"icon_order_sortable_{len(icon_list)}"
@@ -300,36 +359,23 @@ def admin_panel_page(cookies):
                     st.session_state.pop("icon_added")
                 elif new_icon_list != icon_list:
                     # Update icon_order in DB
-                    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                    c = conn.cursor()
-                    for idx, icon in enumerate(new_icon_list, start=1):
-                        c.execute("UPDATE icons SET icon_order = ? WHERE icon = ?", (idx, icon))
-                    conn.commit()
-                    conn.close()
-                    st.toast("Icon order updated!", icon="✅")
-                    time.sleep(1)
+                    reorder_icons(new_icon_list, icon_orders)
+                    flash("Icon order updated!", icon="✅")
                     st.rerun()
                 icon_cols = st.columns(8)
                 for idx, icon in enumerate(new_icon_list):
                     with icon_cols[idx % 8]:
                         st.write(icon)
                         # Check if icon is in use
-                        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                        c = conn.cursor()
-                        c.execute("SELECT COUNT(*) FROM pages WHERE icon = ?", (icon,))
-                        in_use = c.fetchone()[0] > 0
-                        conn.close()
-                        if in_use:
+                        if icon_usage.get(icon):
                             st.button("Delete", key=f"del_icon_{icon}", disabled=True, help="Icon is in use by a page.")
                         else:
                             if st.button("Delete", key=f"del_icon_{icon}"):
-                                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                                c = conn.cursor()
-                                c.execute("DELETE FROM icons WHERE icon = ?", (icon,))
-                                conn.commit()
-                                conn.close()
-                                st.toast(f"Icon '{icon}' deleted.", icon="✅")
-                                time.sleep(1)
+                                with get_connection() as conn:
+                                    c = conn.cursor()
+                                    c.execute("DELETE FROM icons WHERE icon = ?", (icon,))
+                                    conn.commit()
+                                flash(f"Icon '{icon}' deleted.", icon="✅")
                                 st.rerun()
                 st.write("")
                 with st.form("add_icon_form"):
@@ -342,22 +388,155 @@ def admin_panel_page(cookies):
                             st.toast("Icon already exists.", icon="⚠️")
                         else:
                             try:
-                                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                                c = conn.cursor()
-                                # Get next icon_order
-                                c.execute("SELECT MAX(icon_order) FROM icons")
-                                max_order = c.fetchone()[0] or 0
-                                c.execute("INSERT INTO icons (icon, icon_order) VALUES (?, ?)", (new_icon, max_order + 1))
-                                conn.commit()
-                                conn.close()
-                                st.toast(f"Icon '{new_icon}' added.", icon="✅")
+                                with get_connection() as conn:
+                                    c = conn.cursor()
+                                    # Get next icon_order
+                                    c.execute("SELECT MAX(icon_order) FROM icons")
+                                    max_order = c.fetchone()[0] or 0
+                                    c.execute("INSERT INTO icons (icon, icon_order) VALUES (?, ?)", (new_icon, max_order + 1))
+                                    conn.commit()
+                                flash(f"Icon '{new_icon}' added.", icon="✅")
                                 st.session_state["icon_added"] = True
                                 # No need to clear session state for dynamic key
-                                time.sleep(1)
                                 st.rerun()
                             except sqlite3.IntegrityError:
                                 st.toast("Icon already exists.", icon="⚠️")
 
+            # Login Throttling tab
+            with tabs[4]:
+                st.subheader("Login Throttling")
+                throttle_stats = get_throttle_stats()
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Allowed attempts", throttle_stats["allowed"])
+                col2.metric("Rejected attempts", throttle_stats["rejected"])
+                col3.metric("Lockouts", throttle_stats["lockouts"])
+                col4.metric(
+                    "Tracked buckets",
+                    f"{throttle_stats['tracked_buckets']} / {throttle_stats['max_buckets']}",
+                    help=f"{throttle_stats['evictions']} evicted (least recently used)",
+                )
+                hashing_stats = get_hashing_stats()
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric(
+                    "Hashing queue depth",
+                    f"{hashing_stats['queue_depth']} / {hashing_stats['max_queue']}",
+                    help=f"Peak: {hashing_stats['peak_queue_depth']}",
+                )
+                col2.metric("Hashing workers", hashing_stats["max_workers"])
+                col3.metric("Rejected (busy)", hashing_stats["rejected"])
+                col4.metric("bcrypt cost", hashing_stats["rounds"] or "-")
+
+                st.write("**Active Lockouts:**")
+                lockouts = get_lockouts()
+                if not lockouts:
+                    st.write("No active lockouts.")
+                for key, locked_until in lockouts:
+                    col1, col2, col3 = st.columns([3, 3, 2])
+                    with col1:
+                        st.write(key)
+                    with col2:
+                        st.write(locked_until.strftime("%d-%m-%Y %H:%M:%S"))
+                    with col3:
+                        if st.button("Unlock", key=f"unlock_{key}"):
+                            clear_lockout(key)
+                            flash(f"Lockout for {key} lifted.", icon="✅")
+                            st.rerun()
+
+            # Snippet Storage tab
+            with tabs[5]:
+                st.subheader("Snippet Storage")
+                st.write(
+                    f"Snippet bodies of {COMPRESS_THRESHOLD} bytes or more are stored zlib-compressed."
+                )
+                storage = get_snippet_storage_stats()
+                saved = storage["raw_bytes"] - storage["stored_bytes"]
+                ratio = storage["stored_bytes"] / storage["raw_bytes"] if storage["raw_bytes"] else 1
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Snippets", storage["snippets"], help=f"{storage['compressed']} compressed")
+                col2.metric("Code size", _format_bytes(storage["raw_bytes"]))
+                col3.metric("Stored size", _format_bytes(storage["stored_bytes"]), help=f"{ratio:.0%} of the code size")
+                col4.metric("Space saved", _format_bytes(saved))
+
+            # Performance tab
+            with tabs[6]:
+                st.subheader("Performance")
+                trace_stats = sql_trace.get_stats()
+                col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+                col1.metric("Traced runs", f"{trace_stats['runs']} / {trace_stats['window']}")
+                col2.metric("Traced queries", trace_stats["queries"])
+                with col3:
+                    if trace_stats["enabled"]:
+                        if st.button("Disable tracing", key="disable_sql_trace"):
+                            sql_trace.set_enabled(False)
+                            flash("SQL tracing disabled.", icon="✅")
+                            st.rerun()
+                    elif st.button("Enable tracing", key="enable_sql_trace"):
+                        sql_trace.set_enabled(True)
+                        flash("SQL tracing enabled.", icon="✅")
+                        st.rerun()
+                with col4:
+                    if st.button("Clear", key="clear_sql_trace"):
+                        sql_trace.clear()
+                        st.rerun()
+                if not trace_stats["enabled"]:
+                    st.info("SQL tracing is off. Enable it here or start the app with SQL_TRACE=1.")
+
+                st.write("**Queries per page:**")
+                st.dataframe(
+                    [
+                        {
+                            "Page": page["page"],
+                            "Runs": page["runs"],
+                            "Avg queries": round(page["avg_queries"], 1),
+                            "Max queries": page["max_queries"],
+                            "Avg statements": round(page["avg_statements"], 1),
+                            "Avg SQL ms": round(page["avg_sql_ms"], 2),
+                            "Avg run ms": round(page["avg_run_ms"], 1),
+                        }
+                        for page in sql_trace.get_page_stats()
+                    ],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+                st.write("**Slowest statements:**")
+                st.dataframe(
+                    [
+                        {
+                            "Duration ms": round(query["duration_ms"], 2),
+                            "Rows": query["rows"],
+                            "Page": query["page"],
+                            "User": query["user"],
+                            "Statement": query["sql"],
+                            "At": query["started"],
+                        }
+                        for query in sql_trace.get_slowest()
+                    ],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+                st.write(
+                    f"**Repeated statements (run {sql_trace.REPEAT_THRESHOLD}+ times in one run, likely N+1):**"
+                )
+                repeated = sql_trace.get_repeated_statements()
+                if not repeated:
+                    st.write("No repeated statements.")
+                else:
+                    st.dataframe(
+                        [
+                            {
+                                "Page": entry["page"],
+                                "Max per run": entry["max_per_run"],
+                                "Runs": entry["runs"],
+                                "Statement": entry["sql"],
+                            }
+                            for entry in repeated
+                        ],
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+
         else:
             st.toast("Access denied: Admin role required.", icon="❌")
             st.stop()
@@ -370,34 +549,222 @@ def admin_panel_page(cookies):
     st.session_state["confirm_delete_page_active"] = False
 
 
+# Helper to summarize snippet storage: raw code size versus stored size
+def get_snippet_storage_stats():
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT COUNT(*),
+                COALESCE(SUM(code_codec != 'plain'), 0),
+                COALESCE(SUM(code_size), 0),
+                COALESCE(SUM(CASE WHEN code_codec = 'plain' THEN code_size ELSE length(code) END), 0)
+            FROM code_snippets
+            """
+        )
+        snippets, compressed, raw_bytes, stored_bytes = c.fetchone()
+    return {
+        "snippets": snippets,
+        "compressed": compressed,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+    }
+
+
+# Helper to format a byte count for display
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
 # Helper to fetch roles from the database
 def get_roles():
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT role FROM roles")
-    roles = [row[0] for row in c.fetchall()]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT role FROM roles")
+        roles = [row[0] for row in c.fetchall()]
     return roles
 
 
+# Build the WHERE clause and parameters for a username search
+def _user_search_filter(search_query):
+    if not search_query:
+        return "", []
+    escaped = (
+        search_query.lower()
+        .replace("\\", "\\\\")
+        .replace("%", "\\%")
+        .replace("_", "\\_")
+    )
+    return " WHERE u.username LIKE ? ESCAPE '\\'", [f"%{escaped}%"]
+
+
+# Helper to count the users matching a search
+def count_users(search_query=""):
+    where, params = _user_search_filter(search_query)
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM users u" + where, params)
+        return c.fetchone()[0]
+
+
+# Helper to fetch one page of (username, roles) rows matching a search,
+# with every user's roles aggregated in the same query
+def get_users_with_roles(search_query="", limit=50, offset=0):
+    where, params = _user_search_filter(search_query)
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """SELECT u.username,
+                (SELECT GROUP_CONCAT(ur.role, ?) FROM user_roles ur WHERE ur.username = u.username)
+            FROM users u"""
+            + where
+            + " ORDER BY u.username LIMIT ? OFFSET ?",
+            [ROLE_SEPARATOR] + params + [limit, offset],
+        )
+        rows = c.fetchall()
+    return [(username, split_roles(roles)) for username, roles in rows]
+
+
+# Build the WHERE clause and parameters for the session filters: a username
+# prefix (as an index-friendly range) and an inclusive range of expiry dates
+def _session_filter(username_prefix="", expiry_from=None, expiry_to=None):
+    clauses, params = [], []
+    if username_prefix:
+        clauses.append("username >= ? AND username < ?")
+        params.extend([username_prefix, username_prefix + "\U0010ffff"])
+    if expiry_from:
+        clauses.append("expiry >= ?")
+        params.append(datetime.combine(expiry_from, datetime.min.time()))
+    if expiry_to:
+        clauses.append("expiry < ?")
+        params.append(datetime.combine(expiry_to + timedelta(days=1), datetime.min.time()))
+    return clauses, params
+
+
+# Helper to count the sessions matching the filters
+def count_sessions(username_prefix="", expiry_from=None, expiry_to=None):
+    clauses, params = _session_filter(username_prefix, expiry_from, expiry_to)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM sessions" + where, params)
+        return c.fetchone()[0]
+
+
+# Helper to fetch one page of (username, session_id, expiry) rows, latest
+# expiry first. cursor is the (expiry, session_id) of the previous page's
+# last row (keyset pagination). Returns (rows, has_next_page).
+def get_sessions_page(username_prefix="", expiry_from=None, expiry_to=None, limit=50, cursor=None):
+    clauses, params = _session_filter(username_prefix, expiry_from, expiry_to)
+    if cursor:
+        clauses.append("(expiry, session_id) < (?, ?)")
+        params.extend(cursor)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT username, session_id, expiry FROM sessions"
+            + where
+            + " ORDER BY expiry DESC, session_id DESC LIMIT ?",
+            params + [limit + 1],
+        )
+        rows = c.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+# Helper to fetch (username, session count, latest expiry) per user for the
+# matching sessions, users with the most sessions first
+def get_session_summary(username_prefix="", expiry_from=None, expiry_to=None, limit=50):
+    clauses, params = _session_filter(username_prefix, expiry_from, expiry_to)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT username, COUNT(*), MAX(expiry) FROM sessions"
+            + where
+            + " GROUP BY username ORDER BY COUNT(*) DESC, username LIMIT ?",
+            params + [limit],
+        )
+        rows = c.fetchall()
+    # MAX() loses the column's declared type, so convert the timestamp here
+    return [
+        (username, count, datetime.fromisoformat(latest) if latest else None)
+        for username, count, latest in rows
+    ]
+
+
+# Helper to delete every session matching the filters in one statement,
+# except keep_session_id. Returns the number of revoked sessions.
+def revoke_sessions(username_prefix="", expiry_from=None, expiry_to=None, keep_session_id=None):
+    clauses, params = _session_filter(username_prefix, expiry_from, expiry_to)
+    if keep_session_id:
+        clauses.append("session_id != ?")
+        params.append(keep_session_id)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    # Write buffered sessions first so none of them survives the revoke
+    store = get_session_store()
+    store.flush()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM sessions" + where, params)
+        conn.commit()
+    store.invalidate()
+    return c.rowcount
+
+
+# Helper to fetch (icon, icon_order, pages using it) for every icon, in order
+def get_icons_with_usage():
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """SELECT i.icon, i.icon_order, COUNT(p.icon)
+            FROM icons i
+            LEFT JOIN pages p ON p.icon = i.icon
+            GROUP BY i.icon
+            ORDER BY i.icon_order, i.icon"""
+        )
+        return c.fetchall()
+
+
+# Helper to store a new icon order in one transaction, rewriting only the
+# icons whose position changed. current_orders maps icon -> icon_order.
+def reorder_icons(new_icon_list, current_orders):
+    changed = [
+        (idx, icon)
+        for idx, icon in enumerate(new_icon_list, start=1)
+        if current_orders.get(icon) != idx
+    ]
+    if not changed:
+        return 0
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.executemany("UPDATE icons SET icon_order = ? WHERE icon = ?", changed)
+        conn.commit()
+    return len(changed)
+
+
 # Helper to fetch roles for a user
 def get_user_roles(username):
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT role FROM user_roles WHERE username = ?", (username,))
-    user_roles = [row[0] for row in c.fetchall()]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT role FROM user_roles WHERE username = ?", (username,))
+        user_roles = [row[0] for row in c.fetchall()]
     return user_roles
 
 
 # Helper to update roles for a user
 def update_user_roles(username, new_roles):
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("DELETE FROM user_roles WHERE username = ?", (username,))
-    c.executemany(
-        "INSERT INTO user_roles (username, role) VALUES (?, ?)",
-        [(username, r) for r in new_roles],
-    )
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM user_roles WHERE username = ?", (username,))
+        c.executemany(
+            "INSERT INTO user_roles (username, role) VALUES (?, ?)",
+            [(username, r) for r in new_roles],
+        )
+        conn.commit()
+    # Cached sessions carry the roles of their user
+    get_session_store().invalidate()
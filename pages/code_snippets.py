@@ -1,9 +1,26 @@
-import sqlite3
+import re
 import streamlit as st
 from auth import verify_session
-import time
+from db import get_connection, index_snippets, unindex_snippets
+from flash import flash
+from snippet_codec import (
+    REVISION_DELTA,
+    REVISION_SNAPSHOT,
+    decode_code,
+    encode_code,
+    encode_delta,
+    encode_snapshot,
+    replay_revisions,
+)
 import streamlit_ace as st_ace
 
+# Page sizes offered for the snippet listing
+SNIPPET_PAGE_SIZES = [10, 25, 50]
+# Every Nth revision of a snippet is stored in full, the others as deltas
+SNAPSHOT_INTERVAL = 10
+# Longest line of code shown as a search match
+MATCH_LENGTH = 120
+
 
 def code_snippets_page(cookies):
     username, roles = verify_session(cookies)
@@ -27,10 +44,36 @@ def code_snippets_page(cookies):
     if show_modal:
         add_new_snippet_modal(cookies)
 
-    # List all snippets
-    snippets = get_snippets()
+    # Full-text search over title, description and code
+    col_search, col_size, col_page = st.columns([4, 1, 1])
+    with col_search:
+        search_query = st.text_input(
+            "Search snippets",
+            key="snippet_search",
+            placeholder="Search titles, descriptions and code (prefixes match, e.g. 'conn curs')",
+        )
+    with col_size:
+        page_size = st.selectbox("Per page", SNIPPET_PAGE_SIZES, key="snippet_page_size")
+    # Searching or resizing starts again from the first page
+    if st.session_state.get("_snippet_page_filter") != (search_query, page_size):
+        st.session_state["_snippet_page_filter"] = (search_query, page_size)
+        st.session_state["snippet_page"] = 1
+    page_count = max(1, -(-count_snippets(search_query) // page_size))
+    if st.session_state.get("snippet_page", 1) > page_count:
+        st.session_state["snippet_page"] = page_count
+    with col_page:
+        page = st.number_input(
+            f"Page (of {page_count})", min_value=1, max_value=page_count, key="snippet_page"
+        )
+
+    # List one page of snippet metadata, or the best matches when searching.
+    # Code bodies are only fetched for snippets that are shown or edited.
+    snippets = get_snippets(search_query, page_size, (page - 1) * page_size)
     if not snippets:
-        st.info("No code snippets found. Add your first snippet above!")
+        if search_query:
+            st.info("No code snippets match your search.")
+        else:
+            st.info("No code snippets found. Add your first snippet above!")
         # Always clear modal state at the end of the function
         st.session_state["show_add_snippet_modal"] = False
         return
@@ -45,7 +88,10 @@ def code_snippets_page(cookies):
             with col2:
                 if snippet['updated_at'] != snippet['created_at']:
                     st.caption(f"Updated: {snippet['updated_at'].strftime('%Y-%m-%d %H:%M')}")
-            st.code(snippet['code'], language="python")
+            if snippet.get('match'):
+                st.markdown(f"**Match:** {snippet['match']}")
+            if st.toggle("Show code", key=f"show_code_{snippet['id']}"):
+                st.code(get_snippet_code(snippet['id']) or "", language="python")
             # Edit button and modal
             if st.button("✏️ Edit", key=f"edit_{snippet['id']}"):
                 st.session_state[f"edit_snippet_modal_{snippet['id']}"] = True
@@ -74,7 +120,7 @@ def edit_snippet_dialog(snippet, cookies):
         title = st.text_input("Title *", value=snippet['title'], key=f"edit_title_{snippet['id']}")
         description = st.text_area("Description", value=snippet['description'] or "", key=f"edit_description_{snippet['id']}")
         code = st_ace.st_ace(
-            value=snippet['code'],
+            value=get_snippet_code(snippet['id']) or "",
             language="python",
             theme="monokai",
             key=f"edit_code_{snippet['id']}",
@@ -93,9 +139,9 @@ def edit_snippet_dialog(snippet, cookies):
             delete = st.button("Delete", key=f"delete_{snippet['id']}")
         if update:
             if title and code:
-                success = update_snippet(snippet['id'], title, description, code)
+                success = update_snippet(snippet['id'], title, description, code, verify_session(cookies)[0])
                 if success:
-                    st.toast("Snippet updated successfully!", icon="✅")
+                    flash("Snippet updated successfully!", icon="✅")
                     st.session_state.pop(f"edit_snippet_modal_{snippet['id']}", None)
                     st.rerun()
                 else:
@@ -109,37 +155,118 @@ def edit_snippet_dialog(snippet, cookies):
             else:
                 success = delete_snippet(snippet['id'])
                 if success:
-                    st.toast("Snippet deleted successfully!", icon="✅")
+                    flash("Snippet deleted successfully!", icon="✅")
                     st.session_state.pop(f"edit_snippet_modal_{snippet['id']}", None)
                     st.session_state.pop(f"confirm_delete_{snippet['id']}", None)
                     st.rerun()
                 else:
                     st.toast("Failed to delete snippet. Please try again.", icon="❌")
+        if st.toggle("Show history", key=f"show_history_{snippet['id']}"):
+            snippet_history(snippet, title, description, cookies)
     modal()
 
 
-def get_snippets(search_query=""):
-    """Get snippets from database with optional filtering"""
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    
-    query = """
-        SELECT id, title, description, code, created_by, created_at, updated_at 
-        FROM code_snippets 
-        WHERE 1=1
-    """
-    params = []
-    
+def snippet_history(snippet, title, description, cookies):
+    """Revision browser shown inside the edit dialog"""
+    revisions = get_revisions(snippet['id'])
+    if len(revisions) < 2:
+        st.info("No earlier revisions of this snippet.")
+        return
+    stored = sum(rev['stored_size'] for rev in revisions)
+    full = sum(rev['code_size'] for rev in revisions)
+    st.caption(f"{len(revisions)} revisions stored in {stored:,} bytes ({full:,} bytes as full copies).")
+    selected = st.selectbox(
+        "Revision",
+        revisions,
+        format_func=lambda rev: (
+            f"#{rev['revision']} · {rev['created_at'].strftime('%Y-%m-%d %H:%M') if rev['created_at'] else ''}"
+            f" · {rev['created_by'] or 'unknown'}"
+        ),
+        key=f"history_revision_{snippet['id']}",
+    )
+    code = get_revision_code(snippet['id'], selected['revision'])
+    st.code(code, language="python")
+    if selected['revision'] != revisions[0]['revision']:
+        if st.button("Restore this revision", key=f"restore_{snippet['id']}"):
+            if update_snippet(snippet['id'], title, description, code, verify_session(cookies)[0]):
+                flash(f"Revision #{selected['revision']} restored.", icon="✅")
+                st.session_state.pop(f"edit_snippet_modal_{snippet['id']}", None)
+                st.rerun()
+            else:
+                st.toast("Failed to restore revision. Please try again.", icon="❌")
+
+
+def build_match_query(search_query):
+    """Turn free text into an FTS5 query where every word must match as a prefix"""
+    terms = re.findall(r"\w+", search_query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def match_excerpt(code, search_query):
+    """The first line of code containing a search term, with the terms in bold.
+    The search index keeps no content, so FTS5's snippet() is not available."""
+    terms = re.findall(r"\w+", search_query)
+    if not code or not terms:
+        return None
+    pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")\w*", re.IGNORECASE)
+    for line in code.splitlines():
+        found = pattern.search(line)
+        if not found:
+            continue
+        start = max(0, found.start() - MATCH_LENGTH // 3)
+        excerpt = line[start:start + MATCH_LENGTH].strip()
+        excerpt = pattern.sub(lambda m: f"**{m.group(0)}**", excerpt)
+        return ("…" if start else "") + excerpt + ("…" if start + MATCH_LENGTH < len(line) else "")
+    return None
+
+
+def count_snippets(search_query=""):
+    """Count all snippets, or the snippets matching a full-text search"""
     if search_query:
-        query += " AND (title LIKE ? OR description LIKE ?)"
-        search_param = f"%{search_query}%"
-        params.extend([search_param, search_param])
-    
-    query += " ORDER BY updated_at DESC"
+        match_query = build_match_query(search_query)
+        if not match_query:
+            return 0
+        query = "SELECT COUNT(*) FROM code_snippets_fts WHERE code_snippets_fts MATCH ?"
+        params = [match_query]
+    else:
+        query = "SELECT COUNT(*) FROM code_snippets"
+        params = []
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        return c.fetchone()[0]
+
+
+def get_snippets(search_query="", limit=25, offset=0):
+    """Get one page of snippet metadata (without code), ranked by full-text relevance when searching"""
+    if search_query:
+        match_query = build_match_query(search_query)
+        if not match_query:
+            return []
+        # BM25 ranking weighs title over description over code
+        query = """
+            SELECT s.id, s.title, s.description, s.created_by, s.created_at, s.updated_at,
+                s.code_codec, s.code
+            FROM code_snippets_fts
+            JOIN code_snippets s ON s.id = code_snippets_fts.rowid
+            WHERE code_snippets_fts MATCH ?
+            ORDER BY bm25(code_snippets_fts, 10.0, 5.0, 1.0)
+            LIMIT ? OFFSET ?
+        """
+        params = [match_query, limit, offset]
+    else:
+        query = """
+            SELECT id, title, description, created_by, created_at, updated_at, NULL, NULL
+            FROM code_snippets 
+            ORDER BY updated_at DESC
+            LIMIT ? OFFSET ?
+        """
+        params = [limit, offset]
     
-    c.execute(query, params)
-    rows = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        rows = c.fetchall()
     
     snippets = []
     for row in rows:
@@ -147,58 +274,148 @@ def get_snippets(search_query=""):
             'id': row[0],
             'title': row[1],
             'description': row[2],
-            'code': row[3],
-            'created_by': row[4],
-            'created_at': row[5],
-            'updated_at': row[6]
+            'created_by': row[3],
+            'created_at': row[4],
+            'updated_at': row[5],
+            'match': match_excerpt(decode_code(row[6], row[7]), search_query) if search_query else None
         })
     
     return snippets
 
 
+def get_snippet_code(snippet_id):
+    """Fetch the code of a single snippet"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT code_codec, code FROM code_snippets WHERE id = ?", (snippet_id,))
+        row = c.fetchone()
+    return decode_code(*row) if row else None
+
+
 def save_snippet(title, description, code, created_by):
     """Save a new snippet to the database"""
     try:
-        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO code_snippets (title, description, code, created_by)
-            VALUES (?, ?, ?, ?)
-        """, (title, description, code, created_by))
-        conn.commit()
-        conn.close()
+        with get_connection() as conn:
+            c = conn.cursor()
+            stored, codec, size = encode_code(code)
+            c.execute("""
+                INSERT INTO code_snippets (title, description, code, code_codec, code_size, created_by)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (title, description, stored, codec, size, created_by))
+            snippet_id = c.lastrowid
+            index_snippets(c, [(snippet_id, title, description, code)])
+            record_revision(c, snippet_id, code, created_by)
+            conn.commit()
         return True
     except Exception as e:
         st.error(f"Database error: {e}")
         return False
 
 
-def update_snippet(snippet_id, title, description, code):
-    """Update an existing snippet"""
+def update_snippet(snippet_id, title, description, code, edited_by=None):
+    """Update an existing snippet, recording a new revision if the code changed"""
     try:
-        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-        c = conn.cursor()
-        c.execute("""
-            UPDATE code_snippets 
-            SET title = ?, description = ?, code = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (title, description, code, snippet_id))
-        conn.commit()
-        conn.close()
+        with get_connection() as conn:
+            c = conn.cursor()
+            # Take the write lock before reading, so the revision delta and the
+            # index 'delete' use the code that is actually being replaced
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT title, description, code_codec, code FROM code_snippets WHERE id = ?", (snippet_id,))
+            row = c.fetchone()
+            previous = decode_code(row[2], row[3]) if row else None
+            stored, codec, size = encode_code(code)
+            c.execute("""
+                UPDATE code_snippets 
+                SET title = ?, description = ?, code = ?, code_codec = ?, code_size = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (title, description, stored, codec, size, snippet_id))
+            if row:
+                unindex_snippets(c, [(snippet_id, row[0], row[1], previous)])
+                index_snippets(c, [(snippet_id, title, description, code)])
+            if row and previous != code:
+                record_revision(c, snippet_id, code, edited_by, previous)
+            conn.commit()
         return True
     except Exception as e:
         st.error(f"Database error: {e}")
         return False
 
 
+def record_revision(c, snippet_id, code, created_by, previous=None):
+    """Append a revision: a delta against the previous code, or a full snapshot
+    every SNAPSHOT_INTERVAL revisions so rebuilding never replays a long chain"""
+    c.execute(
+        "SELECT COALESCE(MAX(revision), 0) + 1 FROM code_snippet_revisions WHERE snippet_id = ?",
+        (snippet_id,),
+    )
+    revision = c.fetchone()[0]
+    kind, data = REVISION_SNAPSHOT, encode_snapshot(code)
+    if previous is not None and revision % SNAPSHOT_INTERVAL != 1:
+        delta = encode_delta(previous, code)
+        if len(delta) < len(data):
+            kind, data = REVISION_DELTA, delta
+    c.execute("""
+        INSERT INTO code_snippet_revisions (snippet_id, revision, kind, data, code_size, created_by)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (snippet_id, revision, kind, data, len(code.encode("utf-8")), created_by))
+
+
+def get_revisions(snippet_id):
+    """List the revisions of a snippet, newest first"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT revision, kind, code_size, length(data), created_by, created_at
+            FROM code_snippet_revisions
+            WHERE snippet_id = ?
+            ORDER BY revision DESC
+        """, (snippet_id,))
+        rows = c.fetchall()
+    return [
+        {
+            'revision': row[0],
+            'kind': row[1],
+            'code_size': row[2],
+            'stored_size': row[3],
+            'created_by': row[4],
+            'created_at': row[5],
+        }
+        for row in rows
+    ]
+
+
+def get_revision_code(snippet_id, revision):
+    """Rebuild one revision from the nearest snapshot at or before it"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT kind, data FROM code_snippet_revisions
+            WHERE snippet_id = ? AND revision <= ? AND revision >= (
+                SELECT MAX(revision) FROM code_snippet_revisions
+                WHERE snippet_id = ? AND revision <= ? AND kind = ?
+            )
+            ORDER BY revision
+        """, (snippet_id, revision, snippet_id, revision, REVISION_SNAPSHOT))
+        rows = c.fetchall()
+    return replay_revisions(rows)
+
+
 def delete_snippet(snippet_id):
     """Delete a snippet from the database"""
     try:
-        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-        c = conn.cursor()
-        c.execute("DELETE FROM code_snippets WHERE id = ?", (snippet_id,))
-        conn.commit()
-        conn.close()
+        with get_connection() as conn:
+            c = conn.cursor()
+            # The index 'delete' needs exactly the indexed values; read them under
+            # the write lock so a concurrent update cannot change them first
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT title, description, code_codec, code FROM code_snippets WHERE id = ?", (snippet_id,))
+            row = c.fetchone()
+            if row:
+                unindex_snippets(c, [(snippet_id, row[0], row[1], decode_code(row[2], row[3]))])
+            c.execute("DELETE FROM code_snippets WHERE id = ?", (snippet_id,))
+            c.execute("DELETE FROM code_snippet_revisions WHERE snippet_id = ?", (snippet_id,))
+            conn.commit()
         return True
     except Exception as e:
         st.error(f"Database error: {e}")
@@ -245,7 +462,7 @@ def add_new_snippet_modal(cookies):
                 username, _ = verify_session(cookies)
                 success = save_snippet(title, description, code, username)
                 if success:
-                    st.toast("Snippet saved successfully!", icon="✅")
+                    flash("Snippet saved successfully!", icon="✅")
                     for k in [title_key, desc_key, code_key]:
                         if k in st.session_state:
                             del st.session_state[k]
@@ -1,9 +1,8 @@
 import os
 import streamlit as st
-import sqlite3
 from auth import verify_session
+from flash import flash
 import streamlit_ace as st_ace
-import time
 
 
 def edit_page_page(cookies):
@@ -125,14 +124,13 @@ def save_confirm_dialog(selected_file, file_path, edited_content, ace_key, saved
             try:
                 with open(file_path, "w", encoding="utf-8") as f:
                     f.write(edited_content)
-                st.toast(f"Changes saved to {selected_file}.", icon="✅")
+                flash(f"Changes saved to {selected_file}.", icon="✅")
                 st.session_state[ace_key] = edited_content
                 st.session_state[saved_key] = edited_content
-                time.sleep(1)
                 st.session_state.pop("show_save_confirm_modal", None)
                 st.rerun()
             except Exception as e:
-                st.toast(f"Failed to save changes: {e}", icon="❌")
+                flash(f"Failed to save changes: {e}", icon="❌")
                 st.session_state.pop("show_save_confirm_modal", None)
                 st.rerun()
     with col_cancel:
@@ -1,7 +1,34 @@
+import os
+
 import streamlit as st
-import time
 
 from auth import create_session, verify_user
+from flash import flash
+from hashing import HashingBusyError
+from throttle import check_login, record_success
+
+
+# Number of reverse proxies in front of the app. Each appends the address it
+# received the request from to X-Forwarded-For, so only that many entries from
+# the right can be trusted; anything further left is set by the client.
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "0"))
+
+
+# Best-effort client address used for per-client login throttling. Behind
+# TRUSTED_PROXIES proxies it comes from X-Forwarded-For; otherwise from
+# st.context.ip_address (Streamlit 1.45+). Without either, only the username
+# is throttled.
+def get_client_id():
+    context = getattr(st, "context", None)
+    if context is None:
+        return None
+    if TRUSTED_PROXIES:
+        forwarded = context.headers.get("X-Forwarded-For", "")
+        addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+        if len(addresses) >= TRUSTED_PROXIES:
+            return addresses[-TRUSTED_PROXIES]
+        return None
+    return getattr(context, "ip_address", None)
 
 
 # Login page for users
@@ -17,12 +44,23 @@ def login_page(cookies):
         # Validate credentials and create session
         if submit:
             username_lower = username.lower()
-            role = verify_user(username_lower, password)
+            # Reject over-limit attempts before any password hashing
+            allowed, retry_after = check_login(username_lower, get_client_id())
+            if not allowed:
+                st.toast(
+                    f"Too many login attempts. Try again in {retry_after} seconds.",
+                    icon="⛔",
+                )
+                st.stop()
+            try:
+                role = verify_user(username_lower, password)
+            except HashingBusyError:
+                st.toast("The server is busy. Please try again in a moment.", icon="⏳")
+                st.stop()
             if role:
+                record_success(username_lower)
                 create_session(username_lower, cookies)
-                st.toast("Login successful!", icon="✅")
-                # Add a small delay to ensure cookies are saved
-                time.sleep(0.5)
+                flash("Login successful!", icon="✅")
                 st.rerun()
             else:
                 st.toast("Invalid credentials", icon="❌")
@@ -1,9 +1,11 @@
 import os
 import sqlite3
-import time
 import streamlit as st
 import streamlit_sortables as sortables
 from auth import verify_session
+from db import get_connection
+from flash import flash
+from page_registry import invalidate_navigation, unload_page
 
 def pages_manager_page(cookies):
     username, roles = verify_session(cookies)
@@ -30,13 +32,12 @@ def pages_manager_page(cookies):
     # --- View Pages Section ---
     st.header("View Pages")
     all_roles = []
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute(
-        "SELECT page_name, required_role, icon, enabled, file_path, menu_order FROM pages ORDER BY menu_order, page_name"
-    )
-    all_pages = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT page_name, required_role, icon, enabled, file_path, menu_order FROM pages ORDER BY menu_order, page_name"
+        )
+        all_pages = c.fetchall()
     # Add column headings
     header1, header2, header3, header4, header5, header6, header7, header8 = (
         st.columns([3, 3, 2, 2, 2, 4, 2, 3])
@@ -109,16 +110,13 @@ def pages_manager_page(cookies):
             # Set active flag when dialog is open
             st.session_state["edit_page_active"] = True
             # Fetch current values
-            conn = sqlite3.connect(
-                "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-            )
-            c = conn.cursor()
-            c.execute(
-                "SELECT page_name, required_role, icon, enabled FROM pages WHERE page_name = ?",
-                (edit_page,),
-            )
-            row = c.fetchone()
-            conn.close()
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.execute(
+                    "SELECT page_name, required_role, icon, enabled FROM pages WHERE page_name = ?",
+                    (edit_page,),
+                )
+                row = c.fetchone()
             if row:
                 (
                     current_name,
@@ -137,13 +135,12 @@ def pages_manager_page(cookies):
     st.header("Menu Order")
     st.write("Drag and drop to reorder pages in the menu.")
     # Fetch all pages ordered by current menu_order
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute(
-        "SELECT page_name, required_role, icon, enabled, menu_order FROM pages ORDER BY menu_order, page_name"
-    )
-    all_pages = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT page_name, required_role, icon, enabled, menu_order FROM pages ORDER BY menu_order, page_name"
+        )
+        all_pages = c.fetchall()
     # Prepare items for sortables
     sortable_items = [
         f"{icon} {page_name} ({required_role}) {'✅' if enabled else '❌'}"
@@ -190,17 +187,16 @@ def pages_manager_page(cookies):
                         new_page_order.append(page_name)
                         break
         # Update the database with new order
-        conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-        c = conn.cursor()
-        for idx, page_name in enumerate(new_page_order, start=1):
-            c.execute(
-                "UPDATE pages SET menu_order = ? WHERE page_name = ?",
-                (idx, page_name),
-            )
-        conn.commit()
-        conn.close()
-        st.toast("Menu order updated!", icon="✅")
-        time.sleep(1)
+        with get_connection() as conn:
+            c = conn.cursor()
+            for idx, page_name in enumerate(new_page_order, start=1):
+                c.execute(
+                    "UPDATE pages SET menu_order = ? WHERE page_name = ?",
+                    (idx, page_name),
+                )
+            conn.commit()
+        invalidate_navigation()
+        flash("Menu order updated!", icon="✅")
         st.rerun()
 
     # Always reset dialog active flags at the end of the function
@@ -217,11 +213,10 @@ def pages_manager_page(cookies):
 # Helper to fetch roles from the database
 
 def get_roles():
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT role FROM roles")
-    roles = [row[0] for row in c.fetchall()]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT role FROM roles")
+        roles = [row[0] for row in c.fetchall()]
     return roles
 
 # Dialog function for confirming page deletion (moved from admin_panel.py)
@@ -234,18 +229,19 @@ def confirm_delete_page_dialog(page_name):
     with col_a:
         if st.button("Delete"):
             # Remove from DB and delete file
-            conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-            c = conn.cursor()
-            c.execute("SELECT file_path FROM pages WHERE page_name = ?", (page_name,))
-            row = c.fetchone()
-            c.execute("DELETE FROM pages WHERE page_name = ?", (page_name,))
-            conn.commit()
-            conn.close()
-            if row and row[0] and os.path.exists(row[0]):
-                os.remove(row[0])
-            st.toast(f"Page '{page_name}' deleted.", icon="✅")
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.execute("SELECT file_path FROM pages WHERE page_name = ?", (page_name,))
+                row = c.fetchone()
+                c.execute("DELETE FROM pages WHERE page_name = ?", (page_name,))
+                conn.commit()
+            invalidate_navigation()
+            if row and row[0]:
+                unload_page(row[0])
+                if os.path.exists(row[0]):
+                    os.remove(row[0])
+            flash(f"Page '{page_name}' deleted.", icon="✅")
             st.session_state.pop("confirm_delete_page", None)
-            time.sleep(2)
             st.rerun()
     with col_b:
         st.write("")
@@ -261,11 +257,10 @@ def confirm_delete_page_dialog(page_name):
 def add_new_page_modal(cookies):
     all_roles = get_roles()
     # Fetch icon options from the database, ordered by icon_order
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT icon FROM icons ORDER BY icon_order, icon")
-    icon_options = [row[0] for row in c.fetchall()]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT icon FROM icons ORDER BY icon_order, icon")
+        icon_options = [row[0] for row in c.fetchall()]
     with st.form("add_page_form"):
         new_page_name = st.text_input("Page Name", key="add_page_name")
         new_icon = st.selectbox(
@@ -307,29 +302,25 @@ def add_new_page_modal(cookies):
                     # Add new role if it doesn't exist
                     if new_role_input not in all_roles:
                         try:
-                            conn = sqlite3.connect(
-                                "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                            )
-                            c = conn.cursor()
-                            c.execute(
-                                "INSERT INTO roles (role) VALUES (?)",
-                                (new_role_input,),
-                            )
-                            conn.commit()
-                            conn.close()
-                            st.toast(
-                                f"Role '{new_role_input}' added.", icon="✅"
-                            )
+                            with get_connection() as conn:
+                                c = conn.cursor()
+                                c.execute(
+                                    "INSERT INTO roles (role) VALUES (?)",
+                                    (new_role_input,),
+                                )
+                                conn.commit()
+                            # Flashed: the page is created and rerun below
+                            flash(f"Role '{new_role_input}' added.", icon="✅")
                             role_to_use = new_role_input
                             all_roles.append(new_role_input)
                         except sqlite3.IntegrityError:
-                            st.toast(
+                            flash(
                                 f"Role '{new_role_input}' already exists.",
                                 icon="⚠️",
                             )
                             role_to_use = new_role_input
                     else:
-                        st.toast(
+                        flash(
                             f"Role '{new_role_input}' already exists. Using it as required role.",
                             icon="ℹ️",
                         )
@@ -339,30 +330,27 @@ def add_new_page_modal(cookies):
                     f"pages/{new_page_name.lower().replace(' ', '_')}.py"
                 )
                 # Get the next available menu order
-                conn = sqlite3.connect(
-                    "users.db", detect_types=sqlite3.PARSE_DECLTYPES
-                )
-                c = conn.cursor()
-                c.execute("SELECT MAX(menu_order) FROM pages")
-                max_order = c.fetchone()[0]
-                next_order = (max_order or 0) + 1
-                # Check for duplicate page name
-                c.execute(
-                    "SELECT COUNT(*) FROM pages WHERE page_name = ?",
-                    (new_page_name,),
-                )
-                if c.fetchone()[0] > 0:
-                    st.toast(
-                        f"A page with the name '{new_page_name}' already exists.",
-                        icon="⚠️",
+                with get_connection() as conn:
+                    c = conn.cursor()
+                    c.execute("SELECT MAX(menu_order) FROM pages")
+                    max_order = c.fetchone()[0]
+                    next_order = (max_order or 0) + 1
+                    # Check for duplicate page name
+                    c.execute(
+                        "SELECT COUNT(*) FROM pages WHERE page_name = ?",
+                        (new_page_name,),
                     )
-                    conn.close()
-                else:
-                    # Create the file with a basic template if it doesn't exist
-                    if not os.path.exists(file_path):
-                        with open(file_path, "w") as f:
-                            f.write(
-                                f'''import streamlit as st
+                    if c.fetchone()[0] > 0:
+                        st.toast(
+                            f"A page with the name '{new_page_name}' already exists.",
+                            icon="⚠️",
+                        )
+                    else:
+                        # Create the file with a basic template if it doesn't exist
+                        if not os.path.exists(file_path):
+                            with open(file_path, "w") as f:
+                                f.write(
+                                    f'''import streamlit as st
 from auth import verify_session
 
 def {new_page_name.lower().replace(' ', '_')}_page(cookies):
@@ -371,49 +359,47 @@ def {new_page_name.lower().replace(' ', '_')}_page(cookies):
     st.write("This is the {new_page_name} page.")
     st.write(f"Current user: {{username}}")
 '''
+                                )
+                        # Insert into pages
+                        try:
+                            c.execute(
+                                "INSERT INTO pages (page_name, required_role, icon, enabled, file_path, menu_order) VALUES (?, ?, ?, ?, ?, ?)",
+                                (
+                                    new_page_name,
+                                    role_to_use,
+                                    new_icon,
+                                    int(new_enabled),
+                                    file_path,
+                                    next_order,
+                                ),
                             )
-                    # Insert into pages
-                    try:
-                        c.execute(
-                            "INSERT INTO pages (page_name, required_role, icon, enabled, file_path, menu_order) VALUES (?, ?, ?, ?, ?, ?)",
-                            (
-                                new_page_name,
-                                role_to_use,
-                                new_icon,
-                                int(new_enabled),
-                                file_path,
-                                next_order,
-                            ),
-                        )
-                        conn.commit()
+                            conn.commit()
                         
-                        # After adding the new page, enforce menu order:
-                        # 1. Get all pages except Pages Manager, Admin Panel, Code Snippets, and Edit Page
-                        c.execute("SELECT page_name FROM pages WHERE page_name NOT IN ('Admin Panel', 'Pages Manager', 'Code Snippets', 'Edit Page') ORDER BY menu_order, page_name")
-                        normal_pages = [row[0] for row in c.fetchall()]
-                        # 2. Set their menu_order from 1 to N
-                        for idx, page_name in enumerate(normal_pages, start=1):
-                            c.execute("UPDATE pages SET menu_order = ? WHERE page_name = ?", (idx, page_name))
-                        # 3. Set Edit Page to fourth from last, Code Snippets to third from last, Pages Manager to second to last, Admin Panel to last
-                        c.execute("SELECT COUNT(*) FROM pages")
-                        total_pages = c.fetchone()[0]
-                        c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Edit Page'", (total_pages - 3,))
-                        c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Code Snippets'", (total_pages - 2,))
-                        c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Pages Manager'", (total_pages - 1,))
-                        c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Admin Panel'", (total_pages,))
-                        conn.commit()
+                            # After adding the new page, enforce menu order:
+                            # 1. Get all pages except Pages Manager, Admin Panel, Code Snippets, and Edit Page
+                            c.execute("SELECT page_name FROM pages WHERE page_name NOT IN ('Admin Panel', 'Pages Manager', 'Code Snippets', 'Edit Page') ORDER BY menu_order, page_name")
+                            normal_pages = [row[0] for row in c.fetchall()]
+                            # 2. Set their menu_order from 1 to N
+                            for idx, page_name in enumerate(normal_pages, start=1):
+                                c.execute("UPDATE pages SET menu_order = ? WHERE page_name = ?", (idx, page_name))
+                            # 3. Set Edit Page to fourth from last, Code Snippets to third from last, Pages Manager to second to last, Admin Panel to last
+                            c.execute("SELECT COUNT(*) FROM pages")
+                            total_pages = c.fetchone()[0]
+                            c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Edit Page'", (total_pages - 3,))
+                            c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Code Snippets'", (total_pages - 2,))
+                            c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Pages Manager'", (total_pages - 1,))
+                            c.execute("UPDATE pages SET menu_order = ? WHERE page_name = 'Admin Panel'", (total_pages,))
+                            conn.commit()
+                            invalidate_navigation()
                         
-                        st.toast(f"Page '{new_page_name}' created.", icon="✅")
-                        conn.close()
-                        time.sleep(2)
-                        st.session_state["show_add_page_modal"] = False
-                        st.rerun()
-                    except sqlite3.IntegrityError:
-                        st.toast(
-                            f"A page with the name '{new_page_name}' already exists.",
-                            icon="⚠️",
-                        )
-                        conn.close()
+                            flash(f"Page '{new_page_name}' created.", icon="✅")
+                            st.session_state["show_add_page_modal"] = False
+                            st.rerun()
+                        except sqlite3.IntegrityError:
+                            st.toast(
+                                f"A page with the name '{new_page_name}' already exists.",
+                                icon="⚠️",
+                            )
         if cancel_clicked:
             st.session_state["show_add_page_modal"] = False
             st.rerun()
@@ -421,11 +407,10 @@ def {new_page_name.lower().replace(' ', '_')}_page(cookies):
 @st.dialog("Edit Page")
 def edit_page_dialog(current_name, current_role, current_icon, current_enabled):
     # Fetch icon options from the database, ordered by icon_order
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute("SELECT icon FROM icons ORDER BY icon_order, icon")
-    icon_options = [row[0] for row in c.fetchall()]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT icon FROM icons ORDER BY icon_order, icon")
+        icon_options = [row[0] for row in c.fetchall()]
     all_roles = get_roles()
     with st.form("edit_page_form"):
         new_name = st.text_input("Page Name", value=current_name, key="edit_page_name")
@@ -462,17 +447,18 @@ def edit_page_dialog(current_name, current_role, current_icon, current_enabled):
         with col_cancel:
             cancel_edit = st.form_submit_button("Cancel")
         if submit_edit:
-            conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-            c = conn.cursor()
-            c.execute(
-                "UPDATE pages SET page_name = ?, required_role = ?, icon = ?, enabled = ? WHERE page_name = ?",
-                (new_name, new_required_role, new_icon, int(new_enabled), current_name),
-            )
-            conn.commit()
-            conn.close()
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.execute(
+                    "UPDATE pages SET page_name = ?, required_role = ?, icon = ?, enabled = ? WHERE page_name = ?",
+                    (new_name, new_required_role, new_icon, int(new_enabled), current_name),
+                )
+                conn.commit()
+            invalidate_navigation()
             if new_name and current_name and new_name != current_name:
                 old_file = f"pages/{str(current_name).lower().replace(' ', '_')}.py"
                 new_file = f"pages/{str(new_name).lower().replace(' ', '_')}.py"
+                unload_page(old_file)
                 if os.path.exists(old_file):
                     os.rename(old_file, new_file)
                     with open(new_file, "r") as f:
@@ -483,15 +469,15 @@ def edit_page_dialog(current_name, current_role, current_icon, current_enabled):
                         content = content.replace(old_func, new_func, 1)
                         with open(new_file, "w") as f:
                             f.write(content)
-                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                c = conn.cursor()
-                c.execute(
-                    "UPDATE pages SET file_path = ? WHERE page_name = ?",
-                    (new_file, new_name),
-                )
-                conn.commit()
-                conn.close()
-            st.toast(f"Page '{new_name}' updated.", icon="✅")
+                with get_connection() as conn:
+                    c = conn.cursor()
+                    c.execute(
+                        "UPDATE pages SET file_path = ? WHERE page_name = ?",
+                        (new_file, new_name),
+                    )
+                    conn.commit()
+                invalidate_navigation()
+            flash(f"Page '{new_name}' updated.", icon="✅")
             if "edit_page" in st.session_state:
                 del st.session_state["edit_page"]
             if "edit_page_active" in st.session_state:
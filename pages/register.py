@@ -1,21 +1,20 @@
-import sqlite3
-import time
-
 import streamlit as st
 
 from auth import register_user, create_session
+from db import get_connection
+from flash import flash
+from hashing import HashingBusyError
 
 
 # Helper to assign a role to a user in user_roles table
 def assign_role(username, role):
-    conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-    c = conn.cursor()
-    c.execute(
-        "INSERT OR IGNORE INTO user_roles (username, role) VALUES (?, ?)",
-        (username.lower(), role),
-    )
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "INSERT OR IGNORE INTO user_roles (username, role) VALUES (?, ?)",
+            (username.lower(), role),
+        )
+        conn.commit()
 
 
 # Registration page for new users
@@ -32,11 +31,16 @@ def register_page(cookies):
         if submit:
             if password != confirm_password:
                 st.toast("Passwords do not match", icon="⚠️")
-            elif register_user(username.lower(), password, "user"):
-                assign_role(username.lower(), "user")
-                create_session(username.lower(), cookies)
-                st.toast("Registration successful! You are now logged in.", icon="✅")
-                time.sleep(1)
-                st.rerun()
             else:
-                st.toast("Username already exists", icon="❌")
+                try:
+                    registered = register_user(username.lower(), password, "user")
+                except HashingBusyError:
+                    st.toast("The server is busy. Please try again in a moment.", icon="⏳")
+                    st.stop()
+                if registered:
+                    assign_role(username.lower(), "user")
+                    create_session(username.lower(), cookies)
+                    flash("Registration successful! You are now logged in.", icon="✅")
+                    st.rerun()
+                else:
+                    st.toast("Username already exists", icon="❌")
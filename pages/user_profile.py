@@ -1,6 +1,8 @@
 import streamlit as st
 
 from auth import verify_session
+from db import get_connection
+from hashing import HashingBusyError, check_password, hash_password
 
 
 # User profile page for authenticated users
@@ -25,32 +27,30 @@ def user_profile_page(cookies):
             submit = st.form_submit_button("Change Password")
 
             if submit:
-                import sqlite3
-
-                import bcrypt
-
                 # Fetch current hashed password from DB
-                conn = sqlite3.connect("users.db", detect_types=sqlite3.PARSE_DECLTYPES)
-                c = conn.cursor()
-                c.execute("SELECT password FROM users WHERE username = ?", (username,))
-                result = c.fetchone()
-                if not result or not bcrypt.checkpw(
-                    current_password.encode(), result[0]
-                ):
-                    st.toast("Current password is incorrect.", icon="❌")
-                elif new_password != confirm_password:
-                    st.toast("New passwords do not match.", icon="⚠️")
-                elif len(new_password) < 4:
-                    st.toast("New password must be at least 4 characters.", icon="⚠️")
-                else:
-                    hashed = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt())
-                    c.execute(
-                        "UPDATE users SET password = ? WHERE username = ?",
-                        (hashed, username),
-                    )
-                    conn.commit()
-                    st.toast("Password changed successfully.", icon="✅")
-                conn.close()
+                with get_connection() as conn:
+                    c = conn.cursor()
+                    c.execute("SELECT password FROM users WHERE username = ?", (username,))
+                    result = c.fetchone()
+                try:
+                    if not result or not check_password(current_password, result[0]):
+                        st.toast("Current password is incorrect.", icon="❌")
+                    elif new_password != confirm_password:
+                        st.toast("New passwords do not match.", icon="⚠️")
+                    elif len(new_password) < 4:
+                        st.toast("New password must be at least 4 characters.", icon="⚠️")
+                    else:
+                        hashed = hash_password(new_password)
+                        with get_connection() as conn:
+                            c = conn.cursor()
+                            c.execute(
+                                "UPDATE users SET password = ? WHERE username = ?",
+                                (hashed, username),
+                            )
+                            conn.commit()
+                        st.toast("Password changed successfully.", icon="✅")
+                except HashingBusyError:
+                    st.toast("The server is busy. Please try again in a moment.", icon="⏳")
     else:
         st.toast("Please login to access this page.", icon="❌")
         st.stop()
@@ -0,0 +1,419 @@
+import abc
+import atexit
+import hashlib
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from db import ROLE_SEPARATOR, get_connection, split_roles
+
+# Backend used by get_session_store(): "sqlite" (in-process LRU cache in front
+# of SQLite) or "shared" (shared-memory cache in front of SQLite, shared by
+# every server process on the host)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+
+# In-process cache: maximum number of sessions and seconds an entry is trusted
+CACHE_SIZE = 10000
+CACHE_TTL = 30
+# Seconds between two flushes of buffered session writes
+WRITE_BEHIND_INTERVAL = 1.0
+
+# Shared-memory cache: segment name, number of slots and bytes per slot
+SHM_NAME = "streamlit_auth_sessions"
+SHM_SLOTS = 4096
+SHM_SLOT_SIZE = 256
+# Slot header: session key digest, expiry and caching time (epoch seconds), payload length
+_SLOT_HEADER = struct.Struct("<16sddH")
+
+# Marks a session with no buffered write
+_MISSING = object()
+
+
+# Interface of a session store. Records are (username, roles, expiry) tuples.
+class SessionStore(abc.ABC):
+    # Return the record of a live session, or None
+    @abc.abstractmethod
+    def get(self, session_id):
+        ...
+
+    # Store a new session
+    @abc.abstractmethod
+    def add(self, session_id, username, expiry):
+        ...
+
+    # Remove a session
+    @abc.abstractmethod
+    def delete(self, session_id):
+        ...
+
+    # Move the expiry of an active session; the write may be buffered
+    @abc.abstractmethod
+    def extend(self, session_id, expiry):
+        ...
+
+    # Forget cached copies of one session, or of every session, after the
+    # database was changed directly (e.g. roles edited or sessions revoked)
+    def invalidate(self, session_id=None):
+        pass
+
+    # Write buffered changes to the database
+    def flush(self):
+        pass
+
+
+# Sessions in the sessions table. With write_behind, new and deleted sessions
+# are buffered and written in one transaction every WRITE_BEHIND_INTERVAL seconds.
+# Expiry extensions are always buffered that way.
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, write_behind=False):
+        self.write_behind = write_behind
+        # session_id -> (username, expiry) to insert, or None to delete
+        self._pending = OrderedDict()
+        # session_id -> new expiry of a stored session
+        self._extensions = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def get(self, session_id):
+        with self._lock:
+            pending = self._pending.get(session_id, _MISSING)
+        if pending is None:
+            return None
+        with get_connection() as conn:
+            c = conn.cursor()
+            if pending is not _MISSING:
+                # Not written yet; only the roles come from the database
+                username, expiry = pending
+                if expiry <= datetime.now():
+                    return None
+                c.execute("SELECT role FROM user_roles WHERE username = ?", (username,))
+                return username, tuple(sorted(row[0] for row in c.fetchall())), expiry
+            # Resolve the session, its user and the aggregated roles in one query
+            c.execute(
+                """SELECT s.username, GROUP_CONCAT(ur.role, ?), s.expiry
+                FROM sessions s
+                LEFT JOIN user_roles ur ON ur.username = s.username
+                WHERE s.session_id = ? AND s.expiry > ?
+                GROUP BY s.session_id""",
+                (ROLE_SEPARATOR, session_id, datetime.now()),
+            )
+            row = c.fetchone()
+        if not row:
+            return None
+        with self._lock:
+            expiry = self._extensions.get(session_id, row[2])
+        return row[0], tuple(split_roles(row[1])), expiry
+
+    def add(self, session_id, username, expiry):
+        if self.write_behind:
+            self._buffer(session_id, (username, expiry))
+            return
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
+                (session_id, username, expiry),
+            )
+            conn.commit()
+
+    def delete(self, session_id):
+        if self.write_behind:
+            self._buffer(session_id, None)
+            return
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.commit()
+
+    def extend(self, session_id, expiry):
+        with self._lock:
+            pending = self._pending.get(session_id, _MISSING)
+            if pending is None:
+                return
+            if pending is _MISSING:
+                self._extensions[session_id] = expiry
+            else:
+                self._pending[session_id] = (pending[0], expiry)
+            self._start_flusher()
+
+    # Write every buffered change in one transaction. Returns the number of
+    # sessions written; on a busy database the changes stay buffered.
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._extensions:
+                return 0
+            pending, self._pending = self._pending, OrderedDict()
+            extensions, self._extensions = self._extensions, {}
+        updates = [(expiry, session_id) for session_id, expiry in extensions.items()]
+        inserts = [
+            (session_id, write[0], write[1])
+            for session_id, write in pending.items()
+            if write is not None
+        ]
+        deletes = [(session_id,) for session_id, write in pending.items() if write is None]
+        try:
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.executemany(
+                    "INSERT OR REPLACE INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
+                    inserts,
+                )
+                c.executemany("UPDATE sessions SET expiry = ? WHERE session_id = ?", updates)
+                c.executemany("DELETE FROM sessions WHERE session_id = ?", deletes)
+                conn.commit()
+        except sqlite3.OperationalError:
+            # Keep the writes for the next flush, unless newer ones replaced them
+            with self._lock:
+                for session_id, write in pending.items():
+                    self._pending.setdefault(session_id, write)
+                for session_id, expiry in extensions.items():
+                    self._extensions.setdefault(session_id, expiry)
+            return 0
+        return len(pending) + len(extensions)
+
+    def _buffer(self, session_id, write):
+        with self._lock:
+            self._pending[session_id] = write
+            self._extensions.pop(session_id, None)
+            self._start_flusher()
+
+    # Start the background flush thread. Caller holds _lock.
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="session-flush", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(WRITE_BEHIND_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                # Keep flushing; the failed writes are retried or were invalid
+                pass
+
+
+# Bounded LRU cache with a TTL in front of another store. Entries are only
+# trusted for ttl seconds, so changes made by other processes show up quickly.
+class CachedSessionStore(SessionStore):
+    def __init__(self, backend, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.backend = backend
+        self.max_size = max_size
+        self.ttl = ttl
+        # session_id -> (record, cached at (monotonic seconds))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._cache.move_to_end(session_id)
+                else:
+                    del self._cache[session_id]
+                    entry = None
+        if entry is not None:
+            record = entry[0]
+            return record if record[2] > datetime.now() else None
+        record = self.backend.get(session_id)
+        if record is not None:
+            with self._lock:
+                self._cache[session_id] = (record, now)
+                self._cache.move_to_end(session_id)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return record
+
+    def add(self, session_id, username, expiry):
+        self.backend.add(session_id, username, expiry)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._cache.pop(session_id, None)
+        self.backend.delete(session_id)
+
+    def extend(self, session_id, expiry):
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                record = entry[0]
+                self._cache[session_id] = ((record[0], record[1], expiry), entry[1])
+        self.backend.extend(session_id, expiry)
+
+    def invalidate(self, session_id=None):
+        with self._lock:
+            if session_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(session_id, None)
+        self.backend.invalidate(session_id)
+
+    def flush(self):
+        return self.backend.flush()
+
+
+# Open the named shared-memory segment, creating it if needed. The segment is
+# not tied to the lifetime of the process that created it.
+def _open_shared_memory(name, size):
+    from multiprocessing import shared_memory
+
+    kwargs = {"track": False} if sys.version_info >= (3, 13) else {}
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size, **kwargs)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name=name, **kwargs)
+    if not kwargs:
+        # Older Pythons unlink tracked segments when the process exits
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# Fixed-slot cache in shared memory in front of another store, for several
+# server processes on one host. Each session hashes to one slot; a colliding
+# session simply replaces it. Access is serialized with flock on a lock file.
+# Requires a POSIX system.
+class SharedMemorySessionStore(SessionStore):
+    def __init__(self, backend, name=SHM_NAME, slots=SHM_SLOTS, ttl=CACHE_TTL):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.backend = backend
+        self.ttl = ttl
+        self.shm = _open_shared_memory(name, slots * SHM_SLOT_SIZE)
+        # The segment may be larger than requested (page rounding, older config)
+        self.slots = self.shm.size // SHM_SLOT_SIZE
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), "a+b")
+        # flock does not exclude threads sharing the same file descriptor
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, exclusive):
+        with self._thread_lock:
+            self._fcntl.flock(
+                self._lock_file, self._fcntl.LOCK_EX if exclusive else self._fcntl.LOCK_SH
+            )
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._lock_file, self._fcntl.LOCK_UN)
+
+    # Slot key and byte offset of a session
+    def _slot(self, session_id):
+        digest = hashlib.blake2b(session_id.encode(), digest_size=16).digest()
+        return digest, int.from_bytes(digest[:8], "little") % self.slots * SHM_SLOT_SIZE
+
+    def get(self, session_id):
+        digest, offset = self._slot(session_id)
+        with self._locked(exclusive=False):
+            slot = bytes(self.shm.buf[offset:offset + SHM_SLOT_SIZE])
+        key, expiry, cached_at, length = _SLOT_HEADER.unpack_from(slot)
+        now = time.time()
+        if key == digest and now - cached_at < self.ttl:
+            if expiry <= now:
+                return None
+            payload = slot[_SLOT_HEADER.size:_SLOT_HEADER.size + length].decode("utf-8")
+            username, *roles = payload.split(ROLE_SEPARATOR)
+            return username, tuple(roles), datetime.fromtimestamp(expiry)
+        record = self.backend.get(session_id)
+        if record is not None:
+            self._store(digest, offset, record)
+        return record
+
+    def _store(self, digest, offset, record):
+        username, roles, expiry = record
+        payload = ROLE_SEPARATOR.join((username, *roles)).encode("utf-8")
+        if _SLOT_HEADER.size + len(payload) > SHM_SLOT_SIZE:
+            # Too large to cache; always read from the backend
+            return
+        header = _SLOT_HEADER.pack(digest, expiry.timestamp(), time.time(), len(payload))
+        with self._locked(exclusive=True):
+            self.shm.buf[offset:offset + len(header) + len(payload)] = header + payload
+
+    def _clear(self, session_id):
+        digest, offset = self._slot(session_id)
+        with self._locked(exclusive=True):
+            if bytes(self.shm.buf[offset:offset + 16]) == digest:
+                self.shm.buf[offset:offset + _SLOT_HEADER.size] = bytes(_SLOT_HEADER.size)
+
+    def add(self, session_id, username, expiry):
+        self._clear(session_id)
+        self.backend.add(session_id, username, expiry)
+
+    def delete(self, session_id):
+        self._clear(session_id)
+        self.backend.delete(session_id)
+
+    def extend(self, session_id, expiry):
+        digest, offset = self._slot(session_id)
+        with self._locked(exclusive=True):
+            if bytes(self.shm.buf[offset:offset + 16]) == digest:
+                struct.pack_into("<d", self.shm.buf, offset + 16, expiry.timestamp())
+        self.backend.extend(session_id, expiry)
+
+    def invalidate(self, session_id=None):
+        if session_id is None:
+            with self._locked(exclusive=True):
+                self.shm.buf[:] = bytes(self.shm.size)
+        else:
+            self._clear(session_id)
+        self.backend.invalidate(session_id)
+
+    def flush(self):
+        return self.backend.flush()
+
+    def close(self):
+        self.shm.close()
+        self._lock_file.close()
+
+    # Remove the segment from the system once no process needs it
+    def unlink(self):
+        if sys.version_info < (3, 13):
+            from multiprocessing import resource_tracker
+
+            # unlink() unregisters the segment, which _open_shared_memory already did
+            resource_tracker.register(self.shm._name, "shared_memory")
+        self.shm.unlink()
+
+
+# Build a session store for a backend name (see SESSION_BACKEND). By default
+# new and deleted sessions are only buffered by the in-process backend: with
+# the shared backend another process would miss a buffered login, or still
+# accept a buffered logout, until the next flush. Expiry extensions are
+# buffered by both.
+def build_session_store(backend=SESSION_BACKEND, write_behind=None):
+    if backend not in ("sqlite", "shared"):
+        raise ValueError(f"Unknown session backend: {backend}")
+    if write_behind is None:
+        write_behind = backend == "sqlite"
+    store = SQLiteSessionStore(write_behind=write_behind)
+    if backend == "shared":
+        return SharedMemorySessionStore(store)
+    return CachedSessionStore(store)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# The session store of this process, built on first use
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = build_session_store()
+    return _store
@@ -0,0 +1,82 @@
+import difflib
+import json
+import zlib
+
+# Codec markers stored in code_snippets.code_codec
+CODEC_PLAIN = "plain"
+CODEC_ZLIB = "zlib"
+
+# Snippets smaller than this many UTF-8 bytes are stored as plain text;
+# below it zlib's header overhead outweighs the savings
+COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 6
+
+# Revision kinds stored in code_snippet_revisions.kind
+REVISION_SNAPSHOT = "snapshot"
+REVISION_DELTA = "delta"
+
+
+# Encode snippet code for storage. Returns (stored value, codec, size in bytes)
+def encode_code(code):
+    raw = code.encode("utf-8")
+    if len(raw) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(raw, COMPRESS_LEVEL)
+        if len(compressed) < len(raw):
+            return compressed, CODEC_ZLIB, len(raw)
+    return code, CODEC_PLAIN, len(raw)
+
+
+# Decode a stored snippet body back to text
+def decode_code(codec, stored):
+    if stored is None:
+        return None
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(stored).decode("utf-8")
+    if isinstance(stored, bytes):
+        return stored.decode("utf-8")
+    return stored
+
+
+# Encode a full copy of a snippet body for the revision history
+def encode_snapshot(code):
+    return zlib.compress(code.encode("utf-8"), COMPRESS_LEVEL)
+
+
+# Encode the line-based changes from old to new. The delta is a JSON list where
+# [start, end] copies lines of old and a string inserts new text.
+def encode_delta(old, new):
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+    payload = json.dumps(ops, separators=(",", ":"))
+    return zlib.compress(payload.encode("utf-8"), COMPRESS_LEVEL)
+
+
+# Rebuild a snippet body from the previous version and an encoded delta
+def apply_delta(old, delta):
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(delta).decode("utf-8")):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(old_lines[op[0]:op[1]])
+    return "".join(parts)
+
+
+# Rebuild a revision from (kind, data) rows, starting at a snapshot and
+# applying every following delta in order
+def replay_revisions(rows):
+    code = None
+    for kind, data in rows:
+        if kind == REVISION_SNAPSHOT:
+            code = zlib.decompress(data).decode("utf-8")
+        else:
+            code = apply_delta(code, data)
+    return code
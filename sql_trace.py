@@ -0,0 +1,232 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+
+# Tracing is off unless SQL_TRACE is set or it is enabled from the admin panel
+_enabled = os.environ.get("SQL_TRACE", "") not in ("", "0")
+# Number of most recent script runs kept for the reports
+RUN_WINDOW = 500
+# A statement run this many times within one script run is reported as a
+# likely N+1 pattern
+REPEAT_THRESHOLD = 5
+
+# Trace of the script run on the current thread
+_run = threading.local()
+_runs = deque(maxlen=RUN_WINDOW)
+_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+# Collapse whitespace and replace literals, so repeated statements group together
+def normalize(sql):
+    return _LITERALS.sub("?", _WHITESPACE.sub(" ", sql).strip())
+
+
+def is_enabled():
+    return _enabled
+
+
+# Turn tracing on or off for the whole process
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+# Start tracing a script run on the current thread
+def begin_run(page=None, user=None):
+    if not _enabled:
+        _run.trace = None
+        return
+    _run.trace = {
+        "page": page,
+        "user": user,
+        "started": datetime.now(),
+        "start": time.perf_counter(),
+        "statements": 0,
+        "queries": [],
+    }
+
+
+# Set the page or user of the current run once they are known
+def tag_run(page=None, user=None):
+    trace = getattr(_run, "trace", None)
+    if trace is None:
+        return
+    if page is not None:
+        trace["page"] = page
+    if user is not None:
+        trace["user"] = user
+
+
+# Finish the current run and add it to the rolling window
+def end_run():
+    trace = getattr(_run, "trace", None)
+    _run.trace = None
+    if trace is None:
+        return
+    trace["duration_ms"] = (time.perf_counter() - trace.pop("start")) * 1000
+    with _lock:
+        _runs.append(trace)
+
+
+# sqlite3 trace callback: counts every statement SQLite runs for the current
+# script run, including trigger bodies and each row of an executemany
+def _trace_statement(_sql):
+    trace = getattr(_run, "trace", None)
+    if trace is not None:
+        trace["statements"] += 1
+
+
+def _record(sql, elapsed, rows):
+    trace = getattr(_run, "trace", None)
+    if trace is None:
+        return None
+    entry = [sql, elapsed * 1000, rows]
+    trace["queries"].append(entry)
+    return entry
+
+
+# Cursor that times statements and counts the rows they return or change
+class TracedCursor(sqlite3.Cursor):
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        if not _enabled:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._entry = _record(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _enabled:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._entry = _record(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    # Fetching steps the statement, so its time and rows belong to the query
+    def _fetched(self, start, rows):
+        if self._entry is not None:
+            self._entry[1] += (time.perf_counter() - start) * 1000
+            self._entry[2] += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+
+# Connection whose cursors are traced; pass as sqlite3.connect(factory=...)
+class TracedConnection(sqlite3.Connection):
+    traced = False
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+
+# Install or remove the trace callback to match the current setting
+def attach(conn):
+    if conn.traced != _enabled:
+        conn.set_trace_callback(_trace_statement if _enabled else None)
+        conn.traced = _enabled
+
+
+# Forget every recorded run
+def clear():
+    with _lock:
+        _runs.clear()
+
+
+def _snapshot():
+    with _lock:
+        return list(_runs)
+
+
+# The slowest statements in the window as dicts, slowest first
+def get_slowest(limit=20):
+    queries = [
+        {
+            "page": run["page"],
+            "user": run["user"],
+            "started": run["started"],
+            "sql": normalize(sql),
+            "duration_ms": duration,
+            "rows": rows,
+        }
+        for run in _snapshot()
+        for sql, duration, rows in run["queries"]
+    ]
+    queries.sort(key=lambda query: query["duration_ms"], reverse=True)
+    return queries[:limit]
+
+
+# Per-page query statistics over the window, busiest pages first
+def get_page_stats():
+    pages = defaultdict(list)
+    for run in _snapshot():
+        pages[run["page"] or "-"].append(run)
+    stats = []
+    for page, runs in pages.items():
+        counts = [len(run["queries"]) for run in runs]
+        sql_ms = [sum(query[1] for query in run["queries"]) for run in runs]
+        stats.append({
+            "page": page,
+            "runs": len(runs),
+            "avg_queries": sum(counts) / len(runs),
+            "max_queries": max(counts),
+            "avg_statements": sum(run["statements"] for run in runs) / len(runs),
+            "avg_sql_ms": sum(sql_ms) / len(runs),
+            "avg_run_ms": sum(run["duration_ms"] for run in runs) / len(runs),
+        })
+    stats.sort(key=lambda page: page["avg_queries"], reverse=True)
+    return stats
+
+
+# Statements run at least threshold times within a single script run
+# (likely N+1 queries), grouped by page and statement
+def get_repeated_statements(threshold=REPEAT_THRESHOLD):
+    found = {}
+    for run in _snapshot():
+        counts = Counter(normalize(query[0]) for query in run["queries"])
+        for sql, count in counts.items():
+            if count < threshold:
+                continue
+            key = (run["page"] or "-", sql)
+            entry = found.setdefault(key, {"page": key[0], "sql": sql, "runs": 0, "max_per_run": 0})
+            entry["runs"] += 1
+            entry["max_per_run"] = max(entry["max_per_run"], count)
+    return sorted(found.values(), key=lambda entry: entry["max_per_run"], reverse=True)
+
+
+# Window summary for the admin panel
+def get_stats():
+    runs = _snapshot()
+    return {
+        "enabled": _enabled,
+        "runs": len(runs),
+        "window": RUN_WINDOW,
+        "queries": sum(len(run["queries"]) for run in runs),
+    }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Cheap hashes for the default admin user; must be set before hashing is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
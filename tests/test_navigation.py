@@ -0,0 +1,45 @@
+"""The navigation cache must notice page changes made by other processes."""
+import sqlite3
+
+import pytest
+
+import db
+import page_registry
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    db.close_connections()
+    path = str(tmp_path / "users.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.init_db()
+    page_registry.invalidate_navigation()
+    yield path
+    db.close_connections()
+
+
+def _page_names(roles):
+    return [page[0] for page in page_registry.get_navigation(roles)]
+
+
+def test_change_from_other_connection(db_path):
+    assert "Admin Panel" in _page_names({"admin"})
+
+    # Another process changes the pages without touching this process's cache
+    other = sqlite3.connect(db_path)
+    other.execute("UPDATE pages SET enabled = 0 WHERE page_name = 'Admin Panel'")
+    other.commit()
+    other.close()
+
+    assert "Admin Panel" not in _page_names({"admin"})
+
+
+def test_required_role_change_from_other_connection(db_path):
+    assert "Dashboard" in _page_names({"user"})
+
+    other = sqlite3.connect(db_path)
+    other.execute("UPDATE pages SET required_role = 'admin' WHERE page_name = 'Dashboard'")
+    other.commit()
+    other.close()
+
+    assert "Dashboard" not in _page_names({"user"})
@@ -0,0 +1,121 @@
+"""EXPLAIN QUERY PLAN checks: every hot query must be answered from an index.
+
+The statements are recorded with a trace callback while the app's own
+functions run, so the checks follow the queries as they change.
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+import auth
+import db
+import page_registry
+from session_store import SQLiteSessionStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSION_ID = "query-plan-session"
+
+# Statements that read or write rows; PRAGMA, BEGIN and COMMIT are ignored
+_QUERY_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "users.db"))
+    db.init_db()
+    SQLiteSessionStore().add(SESSION_ID, "admin", datetime.now() + timedelta(hours=1))
+
+    statements = []
+    connect = db._connect
+
+    def traced_connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    # Connections already in the pool would not be traced
+    db.close_connections()
+    monkeypatch.setattr(db, "_connect", traced_connect)
+    yield statements
+    db.close_connections()
+
+
+# Load a page module the way navigation does
+def load_page(file_path):
+    return page_registry.load_page_module(os.path.join(ROOT, file_path))
+
+
+# Run func and return the plans of the statements it ran as (sql, plan details)
+def recorded_plans(statements, func, *args, **kwargs):
+    del statements[:]
+    func(*args, **kwargs)
+    queries = [sql for sql in statements if sql.lstrip().upper().startswith(_QUERY_VERBS)]
+    assert queries, f"{func.__name__} ran no queries"
+    with db.get_connection() as conn:
+        return [
+            (sql, [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()])
+            for sql in queries
+        ]
+
+
+# The plan of the one recorded statement that contains fragment
+def plan_of(plans, fragment):
+    matching = [plan for sql, plan in plans if fragment in sql]
+    assert len(matching) == 1, [sql for sql, _ in plans]
+    return matching[0]
+
+
+# Assert that table (or its alias) is read through the given index
+def assert_uses_index(plan, table, index):
+    pattern = re.compile(rf"\b(SEARCH|SCAN) {table}\b.* USING (COVERING )?INDEX {index}\b")
+    assert any(pattern.search(detail) for detail in plan), plan
+
+
+def test_session_lookup(recorder):
+    plans = recorded_plans(recorder, SQLiteSessionStore().get, SESSION_ID)
+    plan = plan_of(plans, "FROM sessions")
+    assert_uses_index(plan, "s", "sqlite_autoindex_sessions_1")
+    assert_uses_index(plan, "ur", "sqlite_autoindex_user_roles_1")
+
+
+def test_expiry_purge(recorder):
+    plans = recorded_plans(recorder, auth.purge_expired_sessions, force=True)
+    assert_uses_index(plan_of(plans, "DELETE FROM sessions"), "sessions", "idx_sessions_expiry_id")
+
+
+def test_navigation(recorder):
+    page_registry.invalidate_navigation()
+    plans = recorded_plans(recorder, page_registry.get_navigation, {"admin"})
+    assert_uses_index(plan_of(plans, "FROM pages WHERE"), "pages", "idx_pages_enabled_order")
+
+
+def test_icon_usage(recorder):
+    admin_panel = load_page("pages/admin_panel.py")
+    plans = recorded_plans(recorder, admin_panel.get_icons_with_usage)
+    assert_uses_index(plan_of(plans, "FROM icons"), "p", "idx_pages_icon")
+
+
+def test_snippet_listing(recorder):
+    code_snippets = load_page("pages/code_snippets.py")
+    plans = recorded_plans(recorder, code_snippets.get_snippets)
+    assert_uses_index(plan_of(plans, "FROM code_snippets"), "code_snippets", "idx_code_snippets_updated_at")
+
+
+def test_sessions_keyset_page(recorder):
+    admin_panel = load_page("pages/admin_panel.py")
+    plans = recorded_plans(
+        recorder, admin_panel.get_sessions_page, cursor=(datetime.now() + timedelta(days=1), SESSION_ID)
+    )
+    plan = plan_of(plans, "FROM sessions")
+    assert_uses_index(plan, "sessions", "idx_sessions_expiry_id")
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
+
+
+def test_sessions_by_username_prefix(recorder):
+    admin_panel = load_page("pages/admin_panel.py")
+    for func in (admin_panel.get_sessions_page, admin_panel.get_session_summary, admin_panel.count_sessions):
+        plans = recorded_plans(recorder, func, username_prefix="adm")
+        assert_uses_index(plan_of(plans, "FROM sessions"), "sessions", "idx_sessions_username_expiry")
@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from db import get_connection
+
+# Token buckets as (capacity, seconds per refilled token)
+USERNAME_LIMIT = (5, 60)
+CLIENT_LIMIT = (20, 6)
+# Maximum number of buckets kept in memory; least recently used are evicted
+MAX_BUCKETS = 10000
+
+# key -> [tokens, last refill (epoch seconds), locked until (epoch seconds)]
+_buckets = OrderedDict()
+_lock = threading.Lock()
+_stats = {"allowed": 0, "rejected": 0, "lockouts": 0, "evictions": 0}
+
+
+# Bucket key for a username
+def username_key(username):
+    return f"user:{username.lower()}"
+
+
+# Bucket key for a client address
+def client_key(client):
+    return f"client:{client}"
+
+
+# Read a persisted lockout for key, as epoch seconds (0 if none)
+def _load_lockout(key):
+    try:
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT locked_until FROM login_lockouts WHERE key = ?", (key,))
+            row = c.fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0].timestamp() if row and row[0] else 0
+
+
+# Persist (or clear, with locked_until=None) the lockout of a key
+def _save_lockout(key, locked_until):
+    try:
+        with get_connection() as conn:
+            c = conn.cursor()
+            if locked_until:
+                c.execute(
+                    "INSERT OR REPLACE INTO login_lockouts (key, locked_until) VALUES (?, ?)",
+                    (key, datetime.fromtimestamp(locked_until)),
+                )
+            else:
+                c.execute("DELETE FROM login_lockouts WHERE key = ?", (key,))
+            conn.commit()
+    except sqlite3.OperationalError:
+        # Database busy; the in-memory lockout still applies
+        pass
+
+
+# Get the bucket for key, refilled up to now. Caller holds _lock.
+def _get_bucket(key, limit, now, locked_until):
+    capacity, refill_seconds = limit
+    bucket = _buckets.get(key)
+    if bucket is None:
+        tokens = 0 if locked_until > now else capacity
+        bucket = [tokens, now, locked_until]
+        _buckets[key] = bucket
+        while len(_buckets) > MAX_BUCKETS:
+            _buckets.popitem(last=False)
+            _stats["evictions"] += 1
+    else:
+        _buckets.move_to_end(key)
+        if bucket[0] < capacity:
+            refilled = int((now - bucket[1]) // refill_seconds)
+            if refilled:
+                bucket[0] = min(capacity, bucket[0] + refilled)
+                bucket[1] += refilled * refill_seconds
+        else:
+            bucket[1] = now
+    return bucket
+
+
+# Take a login attempt from the username and client buckets, before any
+# password hashing happens. Returns (allowed, seconds until retry).
+def check_login(username, client=None):
+    limits = [(username_key(username), USERNAME_LIMIT)]
+    if client:
+        limits.append((client_key(client), CLIENT_LIMIT))
+    # Keys not in memory may carry a lockout from before a restart
+    with _lock:
+        unknown = [key for key, _ in limits if key not in _buckets]
+    persisted = {key: _load_lockout(key) for key in unknown}
+
+    now = time.time()
+    new_lockouts = []
+    with _lock:
+        buckets = [
+            (key, limit, _get_bucket(key, limit, now, persisted.get(key, 0)))
+            for key, limit in limits
+        ]
+        retry_after = max(bucket[2] - now for _, _, bucket in buckets)
+        if retry_after <= 0 and all(bucket[0] >= 1 for _, _, bucket in buckets):
+            for _, _, bucket in buckets:
+                bucket[0] -= 1
+            _stats["allowed"] += 1
+            return True, 0
+        for key, limit, bucket in buckets:
+            if bucket[0] < 1 and bucket[2] <= now:
+                # Locked until the next token is refilled
+                bucket[2] = bucket[1] + limit[1]
+                new_lockouts.append((key, bucket[2]))
+                _stats["lockouts"] += 1
+            retry_after = max(retry_after, bucket[2] - now)
+        _stats["rejected"] += 1
+    for key, locked_until in new_lockouts:
+        _save_lockout(key, locked_until)
+    return False, max(1, int(retry_after + 0.999))
+
+
+# Refill the username bucket after a successful login
+def record_success(username):
+    key = username_key(username)
+    with _lock:
+        bucket = _buckets.get(key)
+        had_lockout = bool(bucket and bucket[2])
+        if bucket:
+            bucket[0] = USERNAME_LIMIT[0]
+            bucket[2] = 0
+    if had_lockout:
+        _save_lockout(key, None)
+
+
+# Lift the lockout of a key (username or client bucket)
+def clear_lockout(key):
+    with _lock:
+        _buckets.pop(key, None)
+    _save_lockout(key, None)
+
+
+# Active lockouts as (key, locked_until) rows, newest first
+def get_lockouts():
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT key, locked_until FROM login_lockouts WHERE locked_until > ? ORDER BY locked_until DESC",
+            (datetime.now(),),
+        )
+        return c.fetchall()
+
+
+# Snapshot of the throttler counters
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["tracked_buckets"] = len(_buckets)
+    stats["max_buckets"] = MAX_BUCKETS
+    return stats